@@ -1,19 +1,58 @@
+import io
 import os
+import json
+import time
+import uuid
 import base64
-import requests
+import random
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+
+import httpx
+from PIL import Image, ImageOps
 from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
 HF_ROUTER_TOKEN = os.getenv("HF_ROUTER_TOKEN")
 
-API_URL    = "https://router.huggingface.co/v1/chat/completions"
+API_URL    = os.getenv("VISION_API_URL", "https://router.huggingface.co/v1/chat/completions")
 MODEL_NAME = "Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic"
 HEADERS    = {"Authorization": f"Bearer {HF_ROUTER_TOKEN}"} if HF_ROUTER_TOKEN else {}
 
+# Upstream calls share one pooled client. At most VISION_MAX_CONCURRENCY
+# run at once; 429 and 5xx answers are retried with jittered backoff until
+# VISION_TIMEOUT seconds after the request started.
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "8"))
+VISION_TIMEOUT         = float(os.getenv("VISION_TIMEOUT", "45"))
+VISION_RETRIES         = int(os.getenv("VISION_RETRIES", "3"))
+VISION_RETRY_BACKOFF   = float(os.getenv("VISION_RETRY_BACKOFF", "0.5"))
+HTTP2                  = importlib.util.find_spec("h2") is not None
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Uploads are decoded once, shrunk so the longer side is at most
+# VISION_MAX_SIDE (about what the model's image tokenizer keeps anyway) and
+# re-encoded as JPEG before they are sent. VISION_MAX_SIDE=0 sends them as-is.
+VISION_MAX_SIDE     = int(os.getenv("VISION_MAX_SIDE", "1024"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+
+# Raw bytes per base64 chunk of the streamed request body; a multiple of 3
+# so the chunks concatenate into one valid base64 string.
+B64_CHUNK = 3 * 16 * 1024
+# Stands in for the base64 image in the serialized payload; ImageBody splits on it.
+IMAGE_MARKER = uuid.uuid4().hex
+
+client   = None
+upstream = None
+
+
 SYSTEM_PROMPT = """You are Tammeny (طمّني), a warm, caring, and knowledgeable health assistant.
 
 STRICT RULES:
@@ -28,7 +67,21 @@ STRICT RULES:
 5. NEVER provide a clinical diagnosis. Always end with a recommendation to consult a doctor.
 6. Keep your response concise"""
 
-app = FastAPI(title="Tammeny Vision API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, upstream
+    client = httpx.AsyncClient(
+        http2=HTTP2,
+        headers=HEADERS,
+        timeout=httpx.Timeout(VISION_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(max_connections=VISION_MAX_CONCURRENCY, max_keepalive_connections=VISION_MAX_CONCURRENCY),
+    )
+    upstream = asyncio.Semaphore(VISION_MAX_CONCURRENCY)
+    yield
+    await client.aclose()
+
+
+app = FastAPI(title="Tammeny Vision API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +91,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.instrument(app, "vision")
+
 
 @app.get("/")
 async def health():
@@ -55,9 +110,10 @@ async def analyze_image(
         return JSONResponse(status_code=503, content={"error": "HF_ROUTER_TOKEN is not configured"})
 
     try:
-        img_bytes    = await image.read()
-        img_b64      = base64.b64encode(img_bytes).decode()
-        content_type = image.content_type or "image/jpeg"
+        original_size = _size(image.file)
+        with metrics.stage("preprocess"):
+            img_bytes, content_type = await asyncio.to_thread(prepare_image, image.file, original_size, image.content_type)
+        metrics.observe_image_bytes(original_size, len(img_bytes))
 
         payload = {
             "model": MODEL_NAME,
@@ -67,14 +123,19 @@ async def analyze_image(
                     "role": "user",
                     "content": [
                         {"type": "text", "text": human_prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:{content_type};base64,{img_b64}"}},
+                        {"type": "image_url", "image_url": {"url": f"data:{content_type};base64,{IMAGE_MARKER}"}},
                     ],
                 },
             ],
             "max_tokens": 600,
         }
+        body = ImageBody(payload, img_bytes)
 
-        resp = requests.post(API_URL, headers=HEADERS, json=payload, timeout=45)
+        try:
+            with metrics.stage("llm"):
+                resp = await post_completion(body)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            return JSONResponse(status_code=504, content={"error": f"Vision API did not answer within {VISION_TIMEOUT:g}s"})
 
         if resp.status_code != 200:
             return JSONResponse(
@@ -86,4 +147,117 @@ async def analyze_image(
         return {"response": message.get("content", ""), "role": message.get("role", "assistant")}
 
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+def prepare_image(file, size: int, content_type: str = None):
+    """(bytes, content type) to send upstream: the upload downscaled and re-encoded as JPEG.
+
+    The image is decoded straight from the upload file, at reduced scale for
+    JPEGs much larger than needed. The upload is sent unchanged when it
+    cannot be decoded, when resizing is off, or when re-encoding would not
+    make it smaller.
+    """
+    as_is = content_type or "image/jpeg"
+    file.seek(0)
+    if VISION_MAX_SIDE <= 0:
+        return file.read(), as_is
+    try:
+        img = Image.open(file)
+        img.draft("RGB", (VISION_MAX_SIDE, VISION_MAX_SIDE))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img  = img.convert("RGBA")
+            flat = Image.new("RGB", img.size, "white")
+            flat.paste(img, mask=img.getchannel("A"))
+            img  = flat
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+    except Exception:
+        out = None
+    if out is None or out.tell() >= size:
+        file.seek(0)
+        return file.read(), as_is
+    return out.getvalue(), "image/jpeg"
+
+
+class ImageBody:
+    """JSON request body whose image data URL is base64-encoded chunk by chunk while it is sent.
+
+    The payload is serialized with IMAGE_MARKER where the base64 goes, so
+    the full base64 string never exists in memory. Each chunks() call
+    starts a fresh stream, which lets retries resend the body.
+    """
+
+    def __init__(self, payload: dict, image: bytes):
+        text = json.dumps(payload, ensure_ascii=False)
+        head, tail  = text.split(IMAGE_MARKER, 1)
+        self.head   = head.encode()
+        self.tail   = tail.encode()
+        self.image  = memoryview(image)
+        self.length = len(self.head) + 4 * ((len(image) + 2) // 3) + len(self.tail)
+
+    async def chunks(self):
+        yield self.head
+        for start in range(0, len(self.image), B64_CHUNK):
+            yield base64.b64encode(self.image[start:start + B64_CHUNK])
+        yield self.tail
+
+
+def _size(file) -> int:
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+async def post_completion(body: ImageBody) -> httpx.Response:
+    """POST to the chat-completions API, retrying 429/5xx and dropped connections until the deadline.
+
+    The last response is returned once retries run out or the next backoff
+    would not fit in the time left; asyncio.TimeoutError means the deadline
+    passed while waiting on the upstream.
+    """
+    deadline = time.monotonic() + VISION_TIMEOUT
+    attempt  = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        try:
+            resp = await asyncio.wait_for(_post(body), remaining)
+        except (httpx.ConnectError, httpx.RemoteProtocolError):
+            if attempt >= VISION_RETRIES:
+                raise
+            resp = None
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt >= VISION_RETRIES:
+                return resp
+
+        delay = _retry_delay(resp, attempt)
+        if delay >= deadline - time.monotonic():
+            if resp is None:
+                raise asyncio.TimeoutError
+            return resp
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _post(body: ImageBody) -> httpx.Response:
+    async with upstream:
+        return await client.post(
+            API_URL, content=body.chunks(),
+            headers={"Content-Type": "application/json", "Content-Length": str(body.length)},
+        )
+
+
+def _retry_delay(resp, attempt: int) -> float:
+    # Honour a numeric Retry-After; otherwise exponential backoff with full jitter.
+    retry_after = resp.headers.get("retry-after") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return random.uniform(0, VISION_RETRY_BACKOFF * 2 ** attempt)
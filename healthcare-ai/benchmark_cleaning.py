@@ -0,0 +1,182 @@
+"""Regression check and microbenchmark for content_cleaner.clean_content.
+
+    python benchmark_cleaning.py
+    python benchmark_cleaning.py --cases 20000 --seed 7 --repeat 200
+
+Every page of a seeded, randomly generated corpus is cleaned by both
+clean_content and reference_clean_content, a verbatim copy of the cleaner
+that ran each boilerplate rule over the page in turn. Any difference is
+printed and the exit status is 1. Both are then timed on realistic pages of
+increasing size.
+"""
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from content_cleaner import clean_content
+
+
+def reference_clean_content(text: str) -> str:
+    if not text:
+        return "No content available."
+
+    match = re.search(r'##\s*Summary\s*\n+([\s\S]+?)(?=\n##\s|\Z)', text, re.IGNORECASE)
+    if match:
+        text = match.group(1).strip()
+    else:
+        cut_pattern = (
+            r'\n##\s*(You May Also Like|Related Articles?|Trending Topics?|Quick Links?|'
+            r'Health Categories|Other Popular|Entities|Companies|Frequently Asked|'
+            r'Better health|Related Tags|SEE ALSO|Legal)'
+        )
+        text = re.split(cut_pattern, text, maxsplit=1, flags=re.IGNORECASE)[0]
+
+        boilerplate = [
+            r'^Published:.*$', r'^Author:.*$', r'^Type:.*$',
+            r'^Advertisement\s*$', r'^Subscribe\s*$',
+            r'^.*newsletter.*$', r'^.*reCAPTCHA.*$',
+            r'^.*non-profit.*$', r'^.*Advertising on our site.*$',
+            r'^.*privacy policy.*$', r'^.*editorial process.*$',
+            r'^Rendered:.*$', r'^Source:.*Getty.*$',
+            r'^Image content:.*$', r'^View image online\s*\(.*?\)$',
+            r'^https?://\S+\s*$',
+        ]
+        for pattern in boilerplate:
+            text = re.sub(pattern, '', text, flags=re.MULTILINE | re.IGNORECASE)
+
+        text = re.sub(r'\n{3,}', '\n\n', text).strip()
+
+        if len(text) > 800:
+            cut = text[:800]
+            last_dot = max(cut.rfind('. '), cut.rfind('.\n'))
+            text = cut[:last_dot + 1] if last_dot > 400 else cut
+
+    text = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    text = re.sub(r'\[[^\]]*\]', '', text)
+    text = re.sub(r'\n{3,}', '\n\n', text).strip()
+
+    return text or "No clear summary available."
+
+
+# ── Corpus ────────────────────────────────────────────────────────────────────
+
+WORDS = (
+    "diabetes blood sugar insulin patients doctor symptoms treatment heart risk "
+    "pressure kidney the a of and with may can help daily diet exercise"
+).split()
+
+BOILERPLATE_LINES = [
+    "Published: 12 March 2024", "Author: Health Desk", "Type: Article", "published:",
+    "Advertisement", "ADVERTISEMENT  ", "Advertisement\t", "Advertisement \r",
+    "Subscribe", "subscribe ", "Subscribe to our newsletter", "Sign up for the Newsletter today.",
+    "Protected by reCAPTCHA", "We are a non-profit organisation.", "Advertising on our site helps support our mission.",
+    "Read our privacy policy", "Learn about our editorial process", "Rendered: 2024-01-01",
+    "Source: Getty Images", "Source: Reuters", "Image content: a doctor",
+    "View image online (opens in new tab)", "View image online  ()", "View image online", "(opens in new tab)",
+    "https://example.com/page", "http://a.b/c  ", "https://example.com/a b", " https://indented.example",
+    "Published: x https://example.com", "https://newsletter.example.com",
+]
+
+STRUCTURE_LINES = [
+    "", "", "", " ", "  ", "\t", "\r", " \r", " ", "\x0c",
+    "## Related Articles", "## Summary", "##Summary", "## Legal", "## Overview", "## see also",
+    "[link](https://x.y)", "See [the guide](http://g) for [more].", "[1]", "[unclosed", "text]",
+    "- bullet point with. a dot", "Ends with a dot.", "Ends. ", "1. Numbered item.",
+]
+
+
+def sentence(rng: random.Random) -> str:
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30)))
+    return words.capitalize() + rng.choice([".", ". ", "", ",", "!", ". [ref](http://r)"])
+
+
+def random_page(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(0, 60)):
+        pick = rng.random()
+        if pick < 0.35:
+            lines.append(rng.choice(BOILERPLATE_LINES))
+        elif pick < 0.6:
+            lines.append(rng.choice(STRUCTURE_LINES))
+        else:
+            lines.append(" ".join(sentence(rng) for _ in range(rng.randint(1, 6))))
+    text = "\n".join(lines)
+    if rng.random() < 0.2:
+        text = "\n" * rng.randint(1, 3) + text
+    if rng.random() < 0.2:
+        text += rng.choice(["\n", "\n\n", " ", "\n  \n"])
+    return text
+
+
+def realistic_page(rng: random.Random, paragraphs: int) -> str:
+    header = ["# Managing type 2 diabetes", "Published: 3 May 2024", "Author: Health Desk", "",
+              "Advertisement", "", "View image online (opens in new tab)", "Source: Getty Images", ""]
+    body = []
+    for i in range(paragraphs):
+        body.append(" ".join(sentence(rng) for _ in range(rng.randint(3, 8))))
+        body.append("")
+        if i % 4 == 3:
+            body += ["Advertisement", "", "Subscribe to our newsletter", "https://example.com/promo", ""]
+    footer = ["## Related Articles", "- [Insulin basics](https://example.com/insulin)",
+              "We are a non-profit organisation.", "Read our privacy policy"]
+    return "\n".join(header + body + footer)
+
+
+# ── Checks ────────────────────────────────────────────────────────────────────
+
+def check(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for i in range(cases):
+        page = random_page(rng)
+        expected, actual = reference_clean_content(page), clean_content(page)
+        if expected != actual:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH case {i}:\n  input:    {page!r}\n  expected: {expected!r}\n  actual:   {actual!r}")
+    for paragraphs in (1, 10, 100, 1000):
+        page = realistic_page(rng, paragraphs)
+        if reference_clean_content(page) != clean_content(page):
+            failures += 1
+            print(f"MISMATCH realistic page with {paragraphs} paragraphs")
+    print(f"{cases + 4} pages checked, {failures} mismatches")
+    return failures
+
+
+def timeit(fn, page: str, repeat: int) -> float:
+    fn(page)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(page)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def bench(repeat: int, seed: int):
+    rng = random.Random(seed)
+    print(f"\n{'paragraphs':>10} {'chars':>9} {'reference_ms':>13} {'clean_ms':>9} {'speedup':>8}")
+    for paragraphs in (5, 50, 500, 5000):
+        page      = realistic_page(rng, paragraphs)
+        reference = timeit(reference_clean_content, page, repeat)
+        current   = timeit(clean_content, page, repeat)
+        print(f"{paragraphs:>10} {len(page):>9} {reference * 1000:>13.3f} {current * 1000:>9.3f} {reference / current:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check clean_content against the sequential reference and time both")
+    parser.add_argument("--cases", type=int, default=5000, help="random pages to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per page size")
+    args = parser.parse_args()
+
+    failures = check(args.cases, args.seed)
+    bench(args.repeat, args.seed)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
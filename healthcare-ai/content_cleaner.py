@@ -0,0 +1,145 @@
+import re
+
+MAX_CHARS = 800
+
+_FLAGS = re.IGNORECASE
+
+SUMMARY = re.compile(r'##\s*Summary\s*\n+([\s\S]+?)(?=\n##\s|\Z)', _FLAGS)
+
+CUT = re.compile(
+    r'\n##\s*(You May Also Like|Related Articles?|Trending Topics?|Quick Links?|'
+    r'Health Categories|Other Popular|Entities|Companies|Frequently Asked|'
+    r'Better health|Related Tags|SEE ALSO|Legal)',
+    _FLAGS,
+)
+
+# Every boilerplate rule, matched against one whole line at a time, in a
+# single alternation. The groups are ranked in the order the rules used to
+# be applied one after another; that order still matters for the rules
+# ending in \s*, which also swallow the blank lines after them.
+BOILERPLATE = re.compile(
+    r'(Published:.*|Author:.*|Type:.*)'
+    r'|(Advertisement\s*)'
+    r'|(Subscribe\s*)'
+    r'|(.*(?:newsletter|reCAPTCHA|non-profit|Advertising on our site|privacy policy|editorial process).*'
+    r'|Rendered:.*|Source:.*Getty.*|Image content:.*|View image online\s*\(.*\))'
+    r'|(https?://\S+\s*)',
+    _FLAGS,
+)
+_SWALLOWS_BLANKS = (2, 3, 5)
+
+# "View image online" alone on a line can pair with a "(...)" line further
+# down, which a line-at-a-time pass cannot see.
+VIEW_IMAGE_OPEN = re.compile(r'View image online\s*', _FLAGS)
+
+LEGACY_BOILERPLATE = [
+    re.compile(pattern, re.MULTILINE | _FLAGS) for pattern in (
+        r'^Published:.*$', r'^Author:.*$', r'^Type:.*$',
+        r'^Advertisement\s*$', r'^Subscribe\s*$',
+        r'^.*newsletter.*$', r'^.*reCAPTCHA.*$',
+        r'^.*non-profit.*$', r'^.*Advertising on our site.*$',
+        r'^.*privacy policy.*$', r'^.*editorial process.*$',
+        r'^Rendered:.*$', r'^Source:.*Getty.*$',
+        r'^Image content:.*$', r'^View image online\s*\(.*?\)$',
+        r'^https?://\S+\s*$',
+    )
+]
+
+MARKDOWN_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+BRACKETED     = re.compile(r'\[[^\]]*\]')
+BLANK_LINES   = re.compile(r'\n{3,}')
+
+
+def clean_content(text: str) -> str:
+    """Reduce a search result page to its summary, or to its first MAX_CHARS characters of body text.
+
+    Gives the same output as running each boilerplate rule over the whole
+    page in turn, but drops boilerplate in one pass over the lines and stops
+    reading as soon as MAX_CHARS characters of the cleaned text are settled.
+    """
+    if not text:
+        return "No content available."
+
+    match = SUMMARY.search(text)
+    if match:
+        text = match.group(1).strip()
+    else:
+        cut = CUT.search(text)
+        if cut:
+            text = text[:cut.start()]
+
+        lines = _strip_boilerplate(text)
+        if lines is None:
+            for pattern in LEGACY_BOILERPLATE:
+                text = pattern.sub('', text)
+        else:
+            text = '\n'.join(lines)
+        text = BLANK_LINES.sub('\n\n', text).strip()
+
+        if len(text) > MAX_CHARS:
+            cut = text[:MAX_CHARS]
+            last_dot = max(cut.rfind('. '), cut.rfind('.\n'))
+            text = cut[:last_dot + 1] if last_dot > 400 else cut
+
+    text = MARKDOWN_LINK.sub(r'\1', text)
+    text = BRACKETED.sub('', text)
+    text = BLANK_LINES.sub('\n\n', text).strip()
+
+    return text or "No clear summary available."
+
+
+def _strip_boilerplate(text: str):
+    """Lines left after removing boilerplate, possibly only a prefix of them; None if the page needs the legacy passes.
+
+    A boilerplate line is emptied rather than removed. One whose rule ends
+    in \\s* also absorbs the following lines that are blank by the time that
+    rule would have run: lines that were blank to begin with, and lines
+    emptied by a rule ranked before it.
+
+    Reading stops once the cleaned text, after blank-line collapsing and
+    stripping, has a non-space character past MAX_CHARS: everything up to
+    there is final, and the caller truncates there anyway.
+    """
+    lines   = []
+    size    = -1    # length of the collapsed, stripped output; -1 until the first non-space character
+    pending = 0     # newlines since the last line with any characters
+    run     = 0     # rank of the \s* rule whose blank run is being absorbed, 0 if none
+
+    start = 0
+    end   = len(text)
+    while start <= end:
+        stop = text.find('\n', start)
+        if stop < 0:
+            stop = end
+        line  = text[start:stop]
+        start = stop + 1
+
+        match = BOILERPLATE.fullmatch(line)
+        rank  = match.lastindex if match else 0
+        blank = not line or line.isspace()
+
+        if run:
+            if blank or (rank and rank < run):
+                continue
+            run = 0
+        if rank:
+            if rank in _SWALLOWS_BLANKS:
+                run = rank
+            line  = ''
+            blank = True
+        elif not blank and VIEW_IMAGE_OPEN.fullmatch(line):
+            return None
+        lines.append(line)
+
+        if size < 0:
+            if not blank:
+                size = len(line.lstrip())
+                pending = 0
+        else:
+            pending += 1
+            if line:
+                size += (2 if pending >= 3 else pending) + len(line)
+                pending = 0
+        if not blank and size - (len(line) - len(line.rstrip())) > MAX_CHARS:
+            break
+    return lines
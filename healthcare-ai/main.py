@@ -1,88 +1,49 @@
 import os
-import re
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+import json
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 load_dotenv()
 
+import metrics
+import web_search
+from search_cache import SearchCache, normalize_query
+
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-OLLAMA_API_KEY  = os.getenv("OLLAMA_API_KEY")
+
+# Cleaned /chat responses keyed by normalized prompt; SEARCH_CACHE_SIZE=0 disables it.
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL  = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_DB   = os.getenv("SEARCH_CACHE_DB") or None
 
 llm            = None
-ollama_client  = None
-tool           = lambda f: f  
 
 try:
     from langchain_mistralai import ChatMistralAI
-    from langchain_core.tools import tool
     if MISTRAL_API_KEY:
         llm = ChatMistralAI(api_key=MISTRAL_API_KEY, model="mistral-small-latest")
 except ImportError:
     pass
 
-try:
-    import ollama
-    if OLLAMA_API_KEY:
-        ollama_client = ollama.Client(headers={"Authorization": f"Bearer {OLLAMA_API_KEY}"})
-except ImportError:
-    pass
-
-
-@tool
-def ollama_websearch(query: str):
-    if not ollama_client:
-        return {"results": []}
-    try:
-        return ollama_client.web_search(query)
-    except Exception as exc:
-        return {"results": [], "error": str(exc)}
-
-
-def clean_content(text: str) -> str:
-    if not text:
-        return "No content available."
-
-    match = re.search(r'##\s*Summary\s*\n+([\s\S]+?)(?=\n##\s|\Z)', text, re.IGNORECASE)
-    if match:
-        text = match.group(1).strip()
-    else:
-        cut_pattern = (
-            r'\n##\s*(You May Also Like|Related Articles?|Trending Topics?|Quick Links?|'
-            r'Health Categories|Other Popular|Entities|Companies|Frequently Asked|'
-            r'Better health|Related Tags|SEE ALSO|Legal)'
-        )
-        text = re.split(cut_pattern, text, maxsplit=1, flags=re.IGNORECASE)[0]
-
-        boilerplate = [
-            r'^Published:.*$', r'^Author:.*$', r'^Type:.*$',
-            r'^Advertisement\s*$', r'^Subscribe\s*$',
-            r'^.*newsletter.*$', r'^.*reCAPTCHA.*$',
-            r'^.*non-profit.*$', r'^.*Advertising on our site.*$',
-            r'^.*privacy policy.*$', r'^.*editorial process.*$',
-            r'^Rendered:.*$', r'^Source:.*Getty.*$',
-            r'^Image content:.*$', r'^View image online\s*\(.*?\)$',
-            r'^https?://\S+\s*$',
-        ]
-        for pattern in boilerplate:
-            text = re.sub(pattern, '', text, flags=re.MULTILINE | re.IGNORECASE)
 
-        text = re.sub(r'\n{3,}', '\n\n', text).strip()
+cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_DB)
 
-        if len(text) > 800:
-            cut = text[:800]
-            last_dot = max(cut.rfind('. '), cut.rfind('.\n'))
-            text = cut[:last_dot + 1] if last_dot > 400 else cut
 
-    text = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', text)
-    text = re.sub(r'\[[^\]]*\]', '', text)
-    text = re.sub(r'\n{3,}', '\n\n', text).strip()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    web_search.start()
+    cache.open()
+    yield
+    await web_search.stop()
 
-    return text or "No clear summary available."
 
-
-app = FastAPI(title="Tammeny Web Search Medical API")
+app = FastAPI(title="Tammeny Web Search Medical API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -92,6 +53,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.instrument(app, "websearch")
+
 
 @app.get("/")
 async def welcome():
@@ -100,27 +63,161 @@ async def welcome():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return {"status": "healthy", "cache": cache.get_stats()}
 
 
 @app.post("/chat")
 async def chat(prompt: str):
-    if not ollama_client:
+    if not web_search.enabled():
         return JSONResponse({"error": "OLLAMA_API_KEY not configured"}, status_code=503)
 
-    result = ollama_websearch.invoke({"query": prompt})
-    entries = result.get("results") if isinstance(result, dict) else getattr(result, "results", [])
+    body = await cache.fetch(cache_key(prompt), lambda: answer(prompt), cacheable=cacheable)
+    return JSONResponse(body)
 
-    if not entries:
-        return JSONResponse({"results": [{"response": "No results found.", "ref": None}]})
-
-    results = []
-    for item in entries:
-        raw_content = item.get("content", "") if isinstance(item, dict) else getattr(item, "content", "")
-        url         = item.get("url", "No reference") if isinstance(item, dict) else getattr(item, "url", "No reference")
-        results.append({
-            "response": clean_content(raw_content or ""),
-            "ref":      url,
+
+@app.api_route("/chat/stream", methods=["GET", "POST"])
+async def chat_stream(prompt: str, format: str = Query(default="sse", pattern="^(sse|ndjson)$")):
+    """/chat as a stream: one "result" event per source as soon as it is cleaned, then a "summary" event.
+
+    Results arrive in the order they finish cleaning; "index" is their
+    place in the /chat response. The search goes through the same cache as
+    /chat: identical prompts streamed at the same time share one upstream
+    search, each stream following its results as they come, and the answer
+    is cached once the search finishes, even if every client has gone. A
+    cached or /chat-coalesced answer is replayed in one go. GET is accepted
+    so browsers can use EventSource.
+    """
+    if not web_search.enabled():
+        return JSONResponse({"error": "OLLAMA_API_KEY not configured"}, status_code=503)
+
+    start = time.perf_counter()
+    key   = cache_key(prompt)
+
+    async def events():
+        first    = None
+        progress = _streams.get(key)
+        if progress is None or progress.done or not cache.enabled:
+            progress = _Progress()
+        fetch = asyncio.ensure_future(
+            cache.fetch(key, lambda: _stream_answer(prompt, key, progress), cacheable=cacheable)
+        )
+        # Served from the cache or by a /chat fetch, progress is never fed.
+        fetch.add_done_callback(lambda _: progress.finish())
+
+        streamed = []
+        async for index, item in progress.follow():
+            if first is None:
+                first = time.perf_counter() - start
+                metrics.observe_stage("first_result", first)
+            streamed.append(index)
+            yield _event(format, "result", {"index": index, **item})
+
+        body   = await fetch
+        cached = not progress.started
+        if not streamed:
+            # The "No results found." placeholder is not a source.
+            for index, item in enumerate(body["results"]):
+                if item["ref"] is not None:
+                    streamed.append(index)
+                    yield _event(format, "result", {"index": index, **item})
+
+        yield _event(format, "summary", {
+            "count":           len(streamed),
+            "queries":         body["queries"],
+            "errors":          progress.errors if progress.started else body.get("errors", []),
+            "cached":          cached,
+            "first_result_ms": round(first * 1000, 1) if first is not None else None,
+            "total_ms":        round((time.perf_counter() - start) * 1000, 1),
         })
 
-    return JSONResponse({"results": results})
\ No newline at end of file
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class _Progress:
+    """Results of one streamed search so far, replayed to every stream following it."""
+
+    def __init__(self):
+        self.items   = []
+        self.errors  = []
+        self.started = False
+        self.done    = False
+        self._update = asyncio.Event()
+
+    def add(self, item):
+        self.items.append(item)
+        self._wake()
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        self._update.set()
+        self._update = asyncio.Event()
+
+    async def follow(self):
+        seen = 0
+        while True:
+            while seen < len(self.items):
+                yield self.items[seen]
+                seen += 1
+            if self.done:
+                return
+            await self._update.wait()
+
+
+# Streamed searches in flight, by cache key, for later streams to follow.
+_streams = {}
+
+
+def cache_key(prompt: str) -> str:
+    # Results also depend on these settings, so a persisted cache must not
+    # serve entries made under different ones.
+    return f"{web_search.SEARCH_MAX_RESULTS}:{int(web_search.SEARCH_TRANSLATE and llm is not None)}:{normalize_query(prompt)}"
+
+
+def cacheable(body: dict) -> bool:
+    return "errors" not in body
+
+
+def _event(format: str, name: str, data: dict) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    if format == "sse":
+        return f"event: {name}\ndata: {payload}\n\n"
+    return json.dumps({"event": name, **data}, ensure_ascii=False) + "\n"
+
+
+async def answer(prompt: str) -> dict:
+    queries, entries, errors = await web_search.search_variants(prompt, llm)
+
+    if not entries:
+        return _no_results(queries, errors)
+
+    results = await web_search.clean_entries(entries)
+    return {"results": results, "queries": queries}
+
+
+async def _stream_answer(prompt: str, key: str, progress: _Progress) -> dict:
+    """answer() for /chat/stream, handing each result to progress as soon as it is cleaned."""
+    progress.started = True
+    _streams[key]    = progress
+    try:
+        queries, entries, progress.errors = await web_search.search_variants(prompt, llm)
+        async for index, item in web_search.clean_as_completed(entries):
+            progress.add((index, item))
+        if not entries:
+            return _no_results(queries, progress.errors)
+        return {"results": [item for _, item in sorted(progress.items, key=lambda r: r[0])], "queries": queries}
+    finally:
+        if _streams.get(key) is progress:
+            del _streams[key]
+        progress.finish()
+
+
+def _no_results(queries: list, errors: list) -> dict:
+    body = {"results": [{"response": "No results found.", "ref": None}], "queries": queries}
+    if errors:
+        body["errors"] = errors
+    return body
\ No newline at end of file
@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Service label for stage timings; set by instrument().
+_service = "app"
+
+REQUESTS = Counter(
+    "tammeny_requests_total", "HTTP requests handled", ["service", "method", "route", "status"]
+)
+ERRORS = Counter(
+    "tammeny_request_errors_total", "HTTP requests that failed with a 5xx or an exception", ["service", "method", "route"]
+)
+IN_FLIGHT = Gauge(
+    "tammeny_requests_in_flight", "HTTP requests currently being handled", ["service"]
+)
+LATENCY = Histogram(
+    "tammeny_request_duration_seconds", "HTTP request latency", ["service", "method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STAGE_LATENCY = Histogram(
+    "tammeny_stage_duration_seconds", "Latency of internal pipeline stages", ["service", "stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+IMAGE_BYTES = Histogram(
+    "tammeny_image_bytes", "Size of images as uploaded and as sent upstream", ["service", "stage"],
+    buckets=(16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6),
+)
+IMAGE_BYTES_SAVED = Histogram(
+    "tammeny_image_bytes_saved", "Bytes per image not sent upstream thanks to downscaling and re-encoding", ["service"],
+    buckets=(0, 16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6),
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.labels(_service, stage).observe(seconds)
+
+
+def observe_image_bytes(original: int, sent: int):
+    IMAGE_BYTES.labels(_service, "original").observe(original)
+    IMAGE_BYTES.labels(_service, "sent").observe(sent)
+    IMAGE_BYTES_SAVED.labels(_service).observe(max(0, original - sent))
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+
+class MetricsMiddleware:
+    """Counts requests and errors and times them per route template."""
+
+    def __init__(self, app, service: str):
+        self.app     = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = IN_FLIGHT.labels(self.service)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route  = _route_label(scope)
+            method = scope["method"]
+            LATENCY.labels(self.service, method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(self.service, method, route, str(status)).inc()
+            if status >= 500:
+                ERRORS.labels(self.service, method, route).inc()
+
+
+def instrument(app: FastAPI, service: str):
+    """Add request metrics and a /metrics endpoint to a service."""
+    global _service
+    _service = service
+    app.add_middleware(MetricsMiddleware, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,4 +1,5 @@
 import os
+import time
 import uvicorn
 from fastapi import FastAPI, Form, UploadFile, File
 from fastapi.responses import JSONResponse, FileResponse
@@ -7,6 +8,8 @@ from pydantic import BaseModel
 from typing import Dict
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
 MISTRAL_API_KEY       = os.getenv("MISTRAL_API_KEY")
@@ -25,6 +28,8 @@ from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -44,10 +49,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-embeddings = HuggingFaceEmbeddings(
+metrics.instrument(app, "rag")
+
+
+class TimedEmbeddings(Embeddings):
+    """Records embedding latency for both PDF indexing and query lookups."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts):
+        with metrics.stage("embedding"):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with metrics.stage("embedding"):
+            return self.inner.embed_query(text)
+
+
+class StageTimer(BaseCallbackHandler):
+    """Times the retriever and LLM runs inside a chain invocation."""
+
+    def __init__(self):
+        self._started = {}
+
+    def _start(self, run_id):
+        self._started[run_id] = time.perf_counter()
+
+    def _end(self, stage, run_id):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            metrics.observe_stage(stage, time.perf_counter() - start)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end("retrieval", run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end("retrieval", run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end("llm", run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end("llm", run_id)
+
+
+embeddings = TimedEmbeddings(HuggingFaceEmbeddings(
     model_name="all-MiniLM-L6-v2",
     model_kwargs={"device": "cpu"},
-)
+))
 
 llm = ChatMistralAI(api_key=MISTRAL_API_KEY, model="mistral-small-latest")
 
@@ -157,7 +216,10 @@ async def chat(request: ChatRequest):
             history_messages_key="chat_history",
             output_messages_key="answer",
         )
-        response = chain.invoke({"input": prompt}, config={"configurable": {"session_id": sid}})
+        response = chain.invoke(
+            {"input": prompt},
+            config={"configurable": {"session_id": sid}, "callbacks": [StageTimer()]},
+        )
         return {"answer": response["answer"]}
 
     general_prompt = ChatPromptTemplate.from_messages([
@@ -170,7 +232,10 @@ async def chat(request: ChatRequest):
         input_messages_key="input",
         history_messages_key="chat_history",
     )
-    response = chain.invoke({"input": prompt}, config={"configurable": {"session_id": sid}})
+    response = chain.invoke(
+        {"input": prompt},
+        config={"configurable": {"session_id": sid}, "callbacks": [StageTimer()]},
+    )
     return {"answer": response.content}
 
 
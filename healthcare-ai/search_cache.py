@@ -0,0 +1,177 @@
+import re
+import json
+import time
+import queue
+import asyncio
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Harakat, Quranic marks, superscript alef and tatweel.
+ARABIC_MARKS = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي"})
+EDGE_PUNCTUATION = " \t\n?!.,;:؟،؛"
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, whitespace, Arabic diacritics and alef/ya spellings so near-identical questions share a key."""
+    text = unicodedata.normalize("NFKC", query or "").casefold()
+    text = ARABIC_MARKS.sub("", text).translate(ARABIC_LETTERS)
+    return " ".join(text.split()).strip(EDGE_PUNCTUATION)
+
+
+class SearchCache:
+    """LRU + TTL cache of /chat responses, with request coalescing and optional SQLite persistence.
+
+    fetch() runs the upstream search at most once per key at a time: callers
+    asking for a key that is already being fetched wait for that fetch
+    instead of starting their own. The fetch runs as its own task, so it is
+    not cancelled when the request that started it goes away. With db_path
+    set, entries are also written to SQLite by a background thread and the
+    newest unexpired ones are loaded again at startup.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0, db_path: str = None):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl         = float(ttl_seconds)
+        self.db_path     = db_path or None
+        self._entries    = OrderedDict()
+        self._inflight   = {}
+        self._db         = None
+        self._pending    = None
+        self.hits        = 0
+        self.misses      = 0
+        self.coalesced   = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    # ── Lookups ───────────────────────────────────────────────────────────────
+
+    async def fetch(self, key: str, fetch, cacheable=lambda value: True):
+        """Cached value for key, or the result of awaiting fetch(); stored if cacheable(result)."""
+        if not self.enabled:
+            return await fetch()
+
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._run(key, fetch, cacheable))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fetch, cacheable):
+        try:
+            value = await fetch()
+            if cacheable(value):
+                self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, value = entry
+        if self.ttl > 0 and time.time() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        stored_at = time.time()
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        if self._pending is not None:
+            self._pending.put((key, stored_at, value))
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled":     self.enabled,
+            "entries":     len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "hit_rate":    round(self.hits / lookups, 3) if lookups else 0.0,
+            "coalesced":   self.coalesced,
+            "in_flight":   len(self._inflight),
+            "evictions":   self.evictions,
+            "expirations": self.expirations,
+            "db_path":     self.db_path,
+        }
+
+    # ── SQLite store ──────────────────────────────────────────────────────────
+
+    def open(self):
+        """Load persisted entries and start the writer thread; a no-op without db_path."""
+        if not self.enabled or self.db_path is None or self._db is not None:
+            return
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY,"
+            " stored_at REAL NOT NULL,"
+            " value TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_time ON search_cache (stored_at)")
+        self._db.commit()
+
+        since = time.time() - self.ttl if self.ttl > 0 else 0
+        rows  = self._db.execute(
+            "SELECT key, stored_at, value FROM search_cache WHERE stored_at >= ? ORDER BY stored_at DESC LIMIT ?",
+            (since, self.max_entries),
+        ).fetchall()
+        for key, stored_at, value in reversed(rows):
+            self._entries[key] = (stored_at, json.loads(value))
+        logger.info("Loaded %d cached searches from %s", len(rows), self.db_path)
+
+        self._pending = queue.Queue()
+        threading.Thread(target=self._write_loop, name="search-cache", daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            rows = [self._pending.get()]
+            while True:
+                try:
+                    rows.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO search_cache (key, stored_at, value) VALUES (?, ?, ?)",
+                    [(key, ts, json.dumps(value, ensure_ascii=False)) for key, ts, value in rows],
+                )
+                if self.ttl > 0:
+                    self._db.execute("DELETE FROM search_cache WHERE stored_at < ?", (time.time() - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM search_cache WHERE key NOT IN "
+                    "(SELECT key FROM search_cache ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.error("Search cache write failed: %s", e)
@@ -0,0 +1,238 @@
+"""Stage-level and end-to-end benchmarks for the imaging pipeline.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.10
+
+Each stage is timed on its own using the images in Data/Images: PIL decode,
+NIHProcessor.preprocess_image, the DenseNet forward pass, interpretation and
+postproc.format_imaging_results. The /analyze/xray and /analyze/xray/batch
+requests are then timed end to end through an in-process test client. With
+--baseline, any benchmark whose median got slower by more than --tolerance
+is reported as a regression and the exit status is 1.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import statistics
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(current_dir, 'models', 'xray_model'))
+
+# Repeated uploads of the same images would otherwise be served from the cache.
+os.environ.setdefault("XRAY_CACHE_SIZE", "0")
+
+SAMPLE_IMAGES = os.path.join(current_dir, '..', '..', 'Data', 'Images')
+
+
+def summarize(samples: list, items_per_sample: int = 1) -> dict:
+    ordered = sorted(samples)
+    p95     = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    median  = statistics.median(ordered)
+    return {
+        "n":          len(ordered),
+        "mean_ms":    round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms":     round(median * 1000, 3),
+        "p95_ms":     round(p95 * 1000, 3),
+        "min_ms":     round(ordered[0] * 1000, 3),
+        "per_second": round(items_per_sample / median, 2) if median else None,
+    }
+
+
+def timeit(fn, repeat: int, warmup: int = 1) -> list:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def load_images(image_dir: str) -> list:
+    paths = sorted(glob.glob(os.path.join(image_dir, '*')))
+    if not paths:
+        raise SystemExit(f"No sample images found in {image_dir}")
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def content_type(name: str) -> str:
+    return "image/png" if name.lower().endswith(".png") else "image/jpeg"
+
+
+# ── Stage benchmarks ──────────────────────────────────────────────────────────
+
+def bench_stages(images: list, batch_sizes: list, repeat: int) -> dict:
+    import torch
+    from PIL import Image
+    from nih_processor import NIHProcessor
+    from xray_analyzer import XRayAnalyzer
+    from postproc import format_imaging_results
+
+    analyzer = XRayAnalyzer()
+    if not analyzer.initialize_model():
+        raise SystemExit("Could not load the X-ray model")
+    model       = analyzer.model_loader.model
+    pathologies = analyzer.model_loader.pathologies
+    default     = NIHProcessor()
+    fast        = NIHProcessor(fast=True)
+    results     = {}
+
+    def per_image(fn):
+        return lambda: [fn(data) for _, data in images]
+
+    n = len(images)
+    results["decode"] = summarize(
+        timeit(per_image(lambda data: Image.open(BytesIO(data)).convert('L').load()), repeat), n)
+    results["preprocess"] = summarize(
+        timeit(per_image(lambda data: default.preprocess_image(BytesIO(data))), repeat), n)
+    results["preprocess_fast"] = summarize(
+        timeit(per_image(lambda data: fast.preprocess_image(BytesIO(data))), repeat), n)
+
+    tensor = torch.cat([default.preprocess_image(BytesIO(data)) for _, data in images])
+    for batch_size in batch_sizes:
+        batch = tensor[torch.arange(batch_size) % n]
+        with torch.no_grad():
+            samples = timeit(lambda: model(batch), repeat)
+        results[f"forward_b{batch_size}"] = summarize(samples, batch_size)
+
+    with torch.no_grad():
+        outputs = model(tensor).numpy()
+    results["interpret"] = summarize(
+        timeit(lambda: [default.interpret_nih_results(row, pathologies, 0.5) for row in outputs], repeat), n)
+    results["interpret_batch"] = summarize(
+        timeit(lambda: default.interpret_nih_batch(outputs, pathologies, 0.5), repeat), n)
+
+    records = analyzer.interpret_batch(outputs, [0.3] * n)
+    results["format"] = summarize(
+        timeit(lambda: [format_imaging_results(r, r["analysis_id"]) for r in records], repeat), n)
+    return results
+
+
+# ── End-to-end benchmarks ─────────────────────────────────────────────────────
+
+def bench_end_to_end(images: list, batch_sizes: list, concurrency_levels: list, repeat: int) -> dict:
+    from fastapi.testclient import TestClient
+    import inference
+    import server
+
+    results = {}
+    with TestClient(server.app) as client:
+        deadline = time.monotonic() + 600
+        while not inference.is_ready():
+            if inference.get_status()["state"] == "failed" or time.monotonic() > deadline:
+                raise SystemExit(f"Imaging service did not become ready: {inference.get_status()}")
+            time.sleep(0.2)
+
+        def single(i: int):
+            name, data = images[i % len(images)]
+            response = client.post("/analyze/xray", files={"file": (name, data, content_type(name))})
+            response.raise_for_status()
+
+        for level in concurrency_levels:
+            requests_per_round = max(level, len(images))
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                samples = timeit(lambda: list(pool.map(single, range(requests_per_round))), repeat)
+            results[f"e2e_single_c{level}"] = summarize(samples, requests_per_round)
+
+        for batch_size in batch_sizes:
+            files = [("files", (name, data, content_type(name)))
+                     for name, data in (images[i % len(images)] for i in range(batch_size))]
+
+            def batch():
+                response = client.post("/analyze/xray/batch", files=files)
+                response.raise_for_status()
+                lines = response.text.splitlines()
+                if len(lines) != batch_size:
+                    raise RuntimeError(f"Expected {batch_size} results, got {len(lines)}")
+
+            results[f"e2e_batch_b{batch_size}"] = summarize(timeit(batch, repeat), batch_size)
+    return results
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"\n{'benchmark':<24} {'baseline p50':>14} {'current p50':>14} {'change':>9}")
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<24} {'-':>14} {current['p50_ms']:>12.2f}ms {'new':>9}")
+            continue
+        change = (current["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] if previous["p50_ms"] else 0.0
+        flag   = "  REGRESSION" if change > tolerance else ""
+        print(f"{name:<24} {previous['p50_ms']:>12.2f}ms {current['p50_ms']:>12.2f}ms {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=SAMPLE_IMAGES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--skip-stages", action="store_true", help="Only run the end-to-end benchmarks")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the stage benchmarks")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against a previously saved results file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    images  = load_images(args.images)
+    results = {}
+    if not args.skip_stages:
+        results.update(bench_stages(images, args.batch_sizes, args.repeat))
+    if not args.skip_e2e:
+        results.update(bench_end_to_end(images, args.batch_sizes, args.concurrency, args.repeat))
+
+    import torch
+    report = {
+        "meta": {
+            "timestamp":     datetime.utcnow().isoformat(),
+            "python":        platform.python_version(),
+            "torch":         torch.__version__,
+            "cpu_count":     os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "images":        len(images),
+            "repeat":        args.repeat,
+            "config":        {k: v for k, v in sorted(os.environ.items()) if k.startswith("XRAY_")},
+        },
+        "results": results,
+    }
+
+    print(f"\n{'benchmark':<24} {'p50':>10} {'p95':>10} {'per sec':>10}")
+    for name, r in results.items():
+        print(f"{name:<24} {r['p50_ms']:>8.2f}ms {r['p95_ms']:>8.2f}ms {r['per_second'] or 0:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
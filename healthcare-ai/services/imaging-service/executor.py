@@ -0,0 +1,237 @@
+import io
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from logs import configure_logging
+
+EXECUTOR_MODES = ("thread", "process", "prefork")
+
+logger = logging.getLogger(__name__)
+
+# Analyzer used by the worker-side functions below. In thread mode it is the
+# service's own analyzer; in process mode each worker process builds its own;
+# in prefork mode workers inherit the parent's analyzer and its shared weights.
+# Forking is only safe while the parent runs no other threads, so prefork
+# executors are started from the server lifespan (inference.start_background).
+_worker_analyzer = None
+
+
+def _init_worker(torch_threads: int, analyzer_options: dict):
+    global _worker_analyzer
+    import torch
+    from xray_analyzer import XRayAnalyzer
+
+    configure_logging()
+    torch.set_num_threads(torch_threads)
+    _worker_analyzer = XRayAnalyzer(**analyzer_options)
+    if not _worker_analyzer.initialize_model():
+        raise RuntimeError("Failed to initialize X-Ray model in worker")
+
+
+def _init_forked_worker(torch_threads: int, pin_cpus: bool, worker_counter):
+    import torch
+
+    configure_logging()
+    with worker_counter.get_lock():
+        index = worker_counter.value
+        worker_counter.value += 1
+
+    if pin_cpus and hasattr(os, "sched_setaffinity"):
+        cpus  = sorted(os.sched_getaffinity(0))
+        start = (index * torch_threads) % len(cpus)
+        os.sched_setaffinity(0, cpus[start:start + torch_threads] or cpus)
+
+    torch.set_num_threads(torch_threads)
+
+
+def _worker_pathologies() -> list:
+    return list(_worker_analyzer.model_loader.pathologies)
+
+
+def _as_file(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+# Worker functions return their stage timings alongside the result so the
+# parent process can record them, whatever process the work ran in.
+
+def _infer(source, analysis_id=None, models=None):
+    timings = {}
+    outputs = _worker_analyzer.infer(_as_file(source), timings, analysis_id, models)
+    return outputs.numpy(), timings
+
+
+def _preprocess(source):
+    timings = {}
+    image   = _worker_analyzer.processor.preprocess_image(_as_file(source), timings=timings)
+    return image[0].numpy(), timings
+
+
+def _predict_batch(images, analysis_ids=None, models=None):
+    import torch
+    start   = time.perf_counter()
+    outputs = _worker_analyzer.predict_batch(torch.from_numpy(images), analysis_ids, models).numpy()
+    return outputs, {"forward": time.perf_counter() - start}
+
+
+def _warm_up(batch_sizes) -> float:
+    """Run throwaway forward passes so the first real request is not a cold one."""
+    import torch
+    start = time.perf_counter()
+    for batch_size in batch_sizes:
+        _worker_analyzer.predict_batch(torch.rand(batch_size, 1, 224, 224) * 2048 - 1024)
+    return time.perf_counter() - start
+
+
+class InferenceExecutor:
+    """Runs decode, preprocessing and the forward pass off the event loop."""
+
+    def __init__(self, mode: str = "thread", workers: int = 4, torch_threads: int = 0, pin_cpus: bool = False):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}'. Expected one of: {', '.join(EXECUTOR_MODES)}")
+        self.mode          = mode
+        self.workers       = max(1, int(workers))
+        self.torch_threads = int(torch_threads)
+        self.pin_cpus      = pin_cpus
+        self._pool         = None
+        self._lock         = threading.Lock()
+        self.pending       = 0
+        self.completed     = 0
+        self.failed        = 0
+
+    def start(self, analyzer):
+        global _worker_analyzer
+        import torch
+        if self.mode == "thread":
+            # With batching on, forward passes are serialized on the batcher
+            # thread, so it may use every core; otherwise workers share them.
+            if self.torch_threads <= 0:
+                batched = analyzer.batcher is not None
+                self.torch_threads = os.cpu_count() if batched else max(1, os.cpu_count() // self.workers)
+            torch.set_num_threads(self.torch_threads)
+            _worker_analyzer = analyzer
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="xray-infer")
+        elif self.mode == "prefork":
+            if self.torch_threads <= 0:
+                self.torch_threads = max(1, os.cpu_count() // self.workers)
+            # Parameters are moved to shared memory before forking so every
+            # worker maps the same pages instead of holding its own copy.
+            analyzer.model_loader.share_memory()
+            _worker_analyzer = analyzer
+            context = multiprocessing.get_context("fork")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_forked_worker,
+                initargs=(self.torch_threads, self.pin_cpus, context.Value("i", 0)),
+            )
+            # A fork context makes the pool fork every worker on this first
+            # submit, before it starts its own management thread. The caller
+            # must not have started any other thread yet.
+            self._pool.submit(_worker_pathologies).result()
+        else:
+            if self.torch_threads <= 0:
+                self.torch_threads = max(1, os.cpu_count() // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.torch_threads, {
+                    "fast_preprocess": analyzer.processor.fast,
+                    "backend":         analyzer.model_loader.backend,
+                    "model_path":      analyzer.model_loader.model_path,
+                    "model_variants":  analyzer.model_loader.variants,
+                    "models":           analyzer.registry.model_ids,
+                    "default_model":    analyzer.registry.default,
+                    "ensemble":         analyzer.registry.ensemble,
+                    "memory_budget_mb": analyzer.registry.memory_budget_mb,
+                }),
+            )
+            analyzer.model_loader.pathologies = self._pool.submit(_worker_pathologies).result()
+        logger.info("Inference executor started", extra={
+            "mode": self.mode, "workers": self.workers, "torch_threads": self.torch_threads,
+        })
+
+    async def infer(self, source, analysis_id: str = None, models=None):
+        """Return the model's output row for one image as a NumPy array, plus stage timings."""
+        analyzer = _worker_analyzer
+        if self.mode == "thread" and analyzer.batcher is not None and analyzer.is_default(models):
+            return await self._infer_batched(analyzer, source, analysis_id)
+        return await self._run(_infer, self._portable(source), analysis_id, models)
+
+    async def _infer_batched(self, analyzer, source, analysis_id):
+        # Only preprocessing holds a pool thread. The forward pass is awaited
+        # on the event loop, so a batch can fill up to XRAY_BATCH_MAX_SIZE
+        # however many pool threads there are.
+        import torch
+        image, timings = await self._run(_preprocess, source)
+        tensor = torch.from_numpy(image)[None]
+        start  = time.perf_counter()
+        result = await asyncio.wrap_future(analyzer.batcher.submit(tensor))
+        timings["forward"] = time.perf_counter() - start
+        return analyzer.finish_prediction(result, tensor, analysis_id).numpy(), timings
+
+    async def preprocess(self, source):
+        """Decode and preprocess one image into a [1, 224, 224] array, plus stage timings."""
+        return await self._run(_preprocess, self._portable(source))
+
+    async def predict_batch(self, images, analysis_ids=None, models=None):
+        """Run one forward pass over an [N, 1, 224, 224] array, plus its timing."""
+        return await self._run(_predict_batch, images, analysis_ids, models)
+
+    def _portable(self, source):
+        if self.mode != "thread" and hasattr(source, "read"):
+            source.seek(0)
+            return source.read()
+        return source
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            self.pending += 1
+        try:
+            result = await asyncio.wrap_future(self._pool.submit(fn, *args))
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def warm_up(self, batch_sizes) -> float:
+        """Warm every worker up at the given batch sizes; returns the slowest worker's time."""
+        if self.mode == "thread":
+            return _warm_up(batch_sizes)
+        # The pool hands each task to an idle worker, so submitting one task
+        # per worker at once warms them all in practice.
+        futures = [self._pool.submit(_warm_up, batch_sizes) for _ in range(self.workers)]
+        return max(f.result() for f in futures)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> dict:
+        pending   = self.pending
+        in_flight = min(pending, self.workers)
+        return {
+            "mode":          self.mode,
+            "workers":       self.workers,
+            "torch_threads": self.torch_threads,
+            "pin_cpus":      self.pin_cpus,
+            "in_flight":     in_flight,
+            "queue_depth":   pending - in_flight,
+            "completed":     self.completed,
+            "failed":        self.failed,
+        }
@@ -1,58 +1,289 @@
 import sys
 import os
 import io
+import time
+import logging
+import numpy as np
+import asyncio
+import threading
 
+# The model modules are imported lazily (see _build_analyzer) so that importing
+# this module, and therefore starting the server, does not pull in torch.
 current_dir = os.path.dirname(os.path.abspath(__file__))
-xray_model_path = os.path.join(current_dir, 'models', 'xray_model')
+sys.path.insert(0, os.path.join(current_dir, 'models', 'xray_model'))
 
-sys.path.insert(0, xray_model_path)
+import metrics
+from executor import InferenceExecutor
+from result_cache import ResultCache
 
-print(f"Python path updated. Looking for models in: {xray_model_path}")
+logger = logging.getLogger(__name__)
 
-try:
-    files = os.listdir(xray_model_path)
-    print(f"Files in xray_model: {files}")
-except Exception as e:
-    print(f"Cannot list xray_model directory: {e}")
-
-try:
-    from model_loader import XRayModelLoader
-    from nih_processor import NIHProcessor
-    from xray_analyzer import XRayAnalyzer
-    print("SUCCESS: All X-Ray modules imported directly!")
-    
-except ImportError as e:
-    print(f"Import failed: {e}")
-    print("Trying alternative import methods...")
-    
-    try:
-        from models.xray_model import model_loader, nih_processor, xray_analyzer
-        XRayModelLoader = model_loader.XRayModelLoader
-        NIHProcessor = nih_processor.NIHProcessor  
-        XRayAnalyzer = xray_analyzer.XRayAnalyzer
-        print("SUCCESS: Imported as package!")
-    except ImportError as e2:
-        print(f"Package import also failed: {e2}")
-        raise ImportError("Cannot import X-Ray model files. Check file paths and contents.")
+XRAY_BATCH_MAX_SIZE   = int(os.getenv("XRAY_BATCH_MAX_SIZE", "8"))
+XRAY_BATCH_MAX_WAIT_MS = float(os.getenv("XRAY_BATCH_MAX_WAIT_MS", "5"))
+XRAY_EXECUTOR         = os.getenv("XRAY_EXECUTOR", "thread")
+XRAY_WORKERS          = int(os.getenv("XRAY_WORKERS", "4"))
+XRAY_TORCH_THREADS    = int(os.getenv("XRAY_TORCH_THREADS", "0"))
+XRAY_PIN_CPUS         = os.getenv("XRAY_PIN_CPUS", "0") == "1"
+XRAY_BATCH_CHUNK_SIZE = int(os.getenv("XRAY_BATCH_CHUNK_SIZE", "8"))
+XRAY_FAST_PREPROCESS  = os.getenv("XRAY_FAST_PREPROCESS", "0") == "1"
+XRAY_BACKEND          = os.getenv("XRAY_BACKEND", "torch")
+XRAY_MODEL_PATH       = os.getenv("XRAY_MODEL_PATH") or None
+XRAY_MODEL_VARIANTS   = tuple(v.strip() for v in os.getenv("XRAY_MODEL_VARIANTS", "").split(",") if v.strip())
+XRAY_HISTORY_SIZE     = int(os.getenv("XRAY_HISTORY_SIZE", "1000"))
+XRAY_HISTORY_DB       = os.getenv("XRAY_HISTORY_DB") or None
+XRAY_EAGER_LOAD       = os.getenv("XRAY_EAGER_LOAD", "1") == "1"
+XRAY_CACHE_SIZE       = int(os.getenv("XRAY_CACHE_SIZE", "1024"))
+XRAY_CACHE_TTL        = float(os.getenv("XRAY_CACHE_TTL", "3600"))
+XRAY_VISUALIZATION_CACHE  = int(os.getenv("XRAY_VISUALIZATION_CACHE", "256"))
+XRAY_VISUALIZATION_IMAGES = int(os.getenv("XRAY_VISUALIZATION_IMAGES", "256"))
+XRAY_JOB_QUEUE_SIZE   = int(os.getenv("XRAY_JOB_QUEUE_SIZE", "64"))
+XRAY_JOB_WORKERS      = int(os.getenv("XRAY_JOB_WORKERS", str(XRAY_WORKERS)))
+XRAY_JOB_LEASE_SECONDS = float(os.getenv("XRAY_JOB_LEASE_SECONDS", "60"))
+XRAY_JOB_RESULT_TTL   = float(os.getenv("XRAY_JOB_RESULT_TTL", "300"))
+XRAY_MODELS           = tuple(m.strip() for m in os.getenv("XRAY_MODELS", "nih,chex,mimic_nb,mimic_ch,pc,rsna,all").split(",") if m.strip())
+XRAY_DEFAULT_MODEL    = os.getenv("XRAY_DEFAULT_MODEL", "nih")
+XRAY_ENSEMBLE         = tuple(m.strip() for m in os.getenv("XRAY_ENSEMBLE", "nih,chex,mimic_ch").split(",") if m.strip())
+XRAY_MODEL_MEMORY_MB  = float(os.getenv("XRAY_MODEL_MEMORY_MB", "0"))
 
 _analyzer = None
+_executor = None
+_history  = None
+_init_lock = threading.Lock()
+_history_lock = threading.Lock()
+_result_cache = ResultCache(XRAY_CACHE_SIZE, XRAY_CACHE_TTL)
+_startup_thread = None
+_status = {"state": "idle", "error": None, "load_seconds": None, "warmup_seconds": None}
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+class VisualizationUnavailable(RuntimeError):
+    pass
+
+class UnknownModel(ValueError):
+    pass
 
 def get_analyzer():
     global _analyzer
-    if _analyzer is None:
-        print("Initializing X-Ray analyzer...")
-        _analyzer = XRayAnalyzer()
-        if not _analyzer.initialize_model():
-            raise RuntimeError("Failed to initialize X-Ray model")
-        print("X-Ray analyzer initialized successfully")
+    with _init_lock:
+        if _analyzer is None:
+            _analyzer = _build_analyzer()
     return _analyzer
 
+def _build_analyzer():
+    from xray_analyzer import XRayAnalyzer
+
+    logger.info("Initializing X-Ray analyzer")
+    batch_size = XRAY_BATCH_MAX_SIZE if XRAY_EXECUTOR == "thread" else 1
+    analyzer   = XRayAnalyzer(
+        max_batch_size  = batch_size,
+        max_wait_ms     = XRAY_BATCH_MAX_WAIT_MS,
+        fast_preprocess = XRAY_FAST_PREPROCESS,
+        # Opening a history database starts its writer thread, which must
+        # not exist yet when prefork workers are forked; see get_executor.
+        history         = None if XRAY_EXECUTOR == "prefork" else get_history(),
+        backend         = XRAY_BACKEND,
+        model_path      = XRAY_MODEL_PATH,
+        model_variants  = XRAY_MODEL_VARIANTS,
+        # Activations are captured where the forward pass runs, so they can
+        # only be served back from this process in thread mode.
+        visualization_cache  = XRAY_VISUALIZATION_CACHE if XRAY_EXECUTOR == "thread" else 0,
+        visualization_images = XRAY_VISUALIZATION_IMAGES,
+        models           = XRAY_MODELS,
+        default_model    = XRAY_DEFAULT_MODEL,
+        ensemble         = XRAY_ENSEMBLE,
+        memory_budget_mb = XRAY_MODEL_MEMORY_MB,
+    )
+    # In process mode the weights live in the worker processes only; in
+    # prefork mode they are loaded here once and shared with the workers.
+    if XRAY_EXECUTOR != "process" and not analyzer.initialize_model():
+        raise RuntimeError("Failed to initialize X-Ray model")
+    logger.info("X-Ray analyzer initialized")
+    return analyzer
+
+def get_executor():
+    global _executor
+    analyzer = get_analyzer()
+    with _init_lock:
+        if _executor is None:
+            executor = InferenceExecutor(XRAY_EXECUTOR, XRAY_WORKERS, XRAY_TORCH_THREADS, XRAY_PIN_CPUS)
+            executor.start(analyzer)
+            if XRAY_EXECUTOR == "prefork":
+                analyzer.history = get_history()
+            _executor = executor
+    return _executor
+
+def warmup_batch_sizes() -> list:
+    sizes = {1, XRAY_BATCH_CHUNK_SIZE}
+    if XRAY_EXECUTOR == "thread":
+        sizes.add(XRAY_BATCH_MAX_SIZE)
+    return sorted(s for s in sizes if s >= 1)
+
+def start_background():
+    """Load and warm the model on a background thread so startup is not blocked.
+
+    In prefork mode the model is loaded and the workers forked right here,
+    on the caller's thread, and only the warm-up runs in the background. Call
+    it from the lifespan before anything else starts threads: a child forked
+    while another thread holds a lock inherits that lock held forever.
+    """
+    global _startup_thread
+    if _startup_thread is None:
+        if XRAY_EXECUTOR == "prefork":
+            _load()
+        _startup_thread = threading.Thread(target=_load_and_warm_up, name="xray-startup", daemon=True)
+        _startup_thread.start()
+
+def _load():
+    try:
+        _status["state"] = "loading"
+        start = time.perf_counter()
+        get_executor()
+        _status["load_seconds"] = round(time.perf_counter() - start, 2)
+    except Exception as e:
+        _status["state"] = "failed"
+        _status["error"] = str(e)
+        logger.exception("X-Ray model startup failed")
+
+def _load_and_warm_up():
+    # A prefork start that failed is not retried here, off the lifespan's thread.
+    if _executor is None and _status["state"] != "failed":
+        _load()
+    if _executor is None:
+        return
+    try:
+        executor = _executor
+        _status["state"] = "warming"
+        _status["warmup_seconds"] = round(executor.warm_up(warmup_batch_sizes()), 2)
+        _status["state"] = "ready"
+        logger.info("X-Ray model ready", extra={
+            "load_seconds": _status["load_seconds"], "warmup_seconds": _status["warmup_seconds"],
+        })
+    except Exception as e:
+        _status["state"] = "failed"
+        _status["error"] = str(e)
+        logger.exception("X-Ray model startup failed")
+
+def get_status() -> dict:
+    return dict(_status)
+
+def is_ready() -> bool:
+    return _status["state"] == "ready"
+
+def check_ready():
+    # Without a background start (XRAY_EAGER_LOAD=0) the model loads on first use.
+    if _startup_thread is not None and not is_ready():
+        raise ModelNotReady(f"X-Ray model is not ready yet (state: {_status['state']})")
+
+async def _ready() -> tuple:
+    """(executor, analyzer), loading them on first use; raises ModelNotReady until they can serve."""
+    check_ready()
+    if _executor is not None:
+        return _executor, _analyzer
+    try:
+        executor = await asyncio.to_thread(get_executor)
+    except Exception as e:
+        logger.exception("X-Ray model load failed")
+        raise ModelNotReady(f"X-Ray model failed to load: {e}") from e
+    _status["state"] = "ready"
+    return executor, _analyzer
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+def _observe(timings: dict):
+    for stage, seconds in timings.items():
+        metrics.observe_stage(stage, seconds)
+
+def _timings_ms(timings: dict) -> dict:
+    return {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+
+def get_history():
+    """The analysis history store. It does not depend on the model, so it is served during warm-up too."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            from history import AnalysisHistory
+            _history = AnalysisHistory(XRAY_HISTORY_SIZE, XRAY_HISTORY_DB)
+    return _history
+
+def get_runtime_stats() -> dict:
+    stats = {
+        "executor": _executor.get_stats() if _executor else {"mode": XRAY_EXECUTOR, "started": False},
+        "batching": {"enabled": XRAY_EXECUTOR == "thread" and XRAY_BATCH_MAX_SIZE > 1, "loaded": False},
+        "cache":    _result_cache.get_stats(),
+        "visualization": {"enabled": False},
+    }
+    # Outside thread mode models are loaded in the worker processes, so the
+    # registry here would only ever show the default one.
+    stats["models"] = {"default": XRAY_DEFAULT_MODEL, "per_worker": XRAY_EXECUTOR != "thread"}
+    if _analyzer is not None and XRAY_EXECUTOR == "thread":
+        stats["batching"]      = _analyzer.get_batching_stats()
+        stats["visualization"] = _analyzer.get_visualization_stats()
+        stats["models"]        = _analyzer.get_model_stats()
+    return stats
+
+def get_models() -> dict:
+    """Hosted models for /models; until the analyzer is built only their ids are known."""
+    if _analyzer is None:
+        models = [{"id": m, "default": m == XRAY_DEFAULT_MODEL, "loaded": False}
+                  for m in dict.fromkeys((XRAY_DEFAULT_MODEL, *XRAY_MODELS))]
+        return {"default": XRAY_DEFAULT_MODEL, "ensemble": list(XRAY_ENSEMBLE), "models": models}
+    registry = _analyzer.registry
+    return {"default": registry.default, "ensemble": list(registry.ensemble), "models": registry.catalog()}
+
+async def resolve_models(model: str = None) -> tuple:
+    """Registry ids for a request's `model` value; raises UnknownModel for anything not hosted."""
+    _, analyzer = await _ready()
+    try:
+        return analyzer.registry.resolve(model)
+    except ValueError as e:
+        raise UnknownModel(str(e)) from e
+
+def visualizations_enabled(record: dict = None) -> bool:
+    """Whether heatmaps can be served, and for a record, whether it came from the default model."""
+    if _analyzer is None or _analyzer.visualizer is None:
+        return False
+    return record is None or record.get("model") == _analyzer.registry.default
+
+def render_visualization(analysis_id: str, pathology: str = None):
+    """(pathology, PNG bytes) for a Grad-CAM overlay; the PNG is None once the analysis has been evicted.
+
+    Without a pathology the one with the strongest class score is drawn.
+    Blocking; call it off the event loop.
+    """
+    if not visualizations_enabled():
+        raise VisualizationUnavailable(
+            "Visualizations need XRAY_EXECUTOR=thread, the torch backend and XRAY_VISUALIZATION_CACHE > 0"
+        )
+    visualizer = _analyzer.visualizer
+    if pathology is None:
+        pathology = visualizer.default_pathology(analysis_id)
+        if pathology is None:
+            return None, None
+    else:
+        pathology = pathology.replace(" ", "_")
+        if not pathology or pathology not in visualizer.pathologies:
+            raise ValueError(f"Unknown pathology '{pathology}'")
+
+    start = time.perf_counter()
+    png   = visualizer.render(analysis_id, pathology)
+    metrics.observe_stage("visualize", time.perf_counter() - start)
+    return pathology, png
+
 async def analyze_xray_image(
     file,
-    confidence_threshold: float = 0.5  
+    confidence_threshold: float = 0.5,
+    image_hash: str = None,
+    analysis_id: str = None,
+    models: tuple = None,
 ):
     try:
-        analyzer = get_analyzer()
+        executor, analyzer = await _ready()
         
         if hasattr(file, 'read'):
             image_file = file
@@ -61,15 +292,87 @@ async def analyze_xray_image(
             contents = await file.read()
             image_file = io.BytesIO(contents)
         
-        print(f"🔍 Processing image - Type: {type(image_file)}")
-        print(f"🎯 Confidence threshold: {confidence_threshold}")  
-        
-        results = analyzer.analyze_xray(
-            image_file, 
-            confidence_threshold=confidence_threshold  
-        )
-        
-        return results
+        # The cache holds the raw probability vector, so a hit with a
+        # different threshold only needs to be re-interpreted. Each model or
+        # ensemble has its own entry for the same image.
+        models    = tuple(models or (analyzer.registry.default,))
+        cache_key = f"{analyzer.registry.key(models)}:{image_hash}" if image_hash else None
+        timings   = {}
+        entry     = _result_cache.get(cache_key) if cache_key else None
+        cached    = entry is not None
+        if cached:
+            outputs, source_id = entry
+            if analyzer.visualizer is not None and analysis_id:
+                analyzer.visualizer.link(analysis_id, source_id)
+        else:
+            outputs, timings = await executor.infer(image_file, analysis_id, models)
+            if cache_key:
+                _result_cache.put(cache_key, (outputs, analysis_id))
+
+        start  = time.perf_counter()
+        record = analyzer.interpret(outputs, confidence_threshold, analysis_id, models)
+        timings["postprocess"] = time.perf_counter() - start
+        _observe(timings)
+
+        logger.info("Analysis complete", extra={
+            "analysis_id": record["analysis_id"],
+            "model":       record["model"],
+            "cache_hit":   cached,
+            "findings":    record["total_findings"],
+            "timings_ms":  _timings_ms(timings),
+        })
+        return record
         
+    except ModelNotReady:
+        raise
     except Exception as e:
-        raise Exception(f"X-Ray analysis error: {str(e)}")
\ No newline at end of file
+        raise Exception(f"X-Ray analysis error: {str(e)}")
+
+async def analyze_xray_batch(items, confidence_threshold: float = 0.5, batch_id: str = None, models: tuple = None):
+    """Analyze many (name, source) pairs, yielding (index, name, result, error) as chunks finish.
+
+    Images are decoded and preprocessed in parallel on the executor, then run
+    through the model XRAY_BATCH_CHUNK_SIZE at a time.
+    """
+    executor, analyzer = await _ready()
+
+    async def prepare(index, name, source):
+        try:
+            image, timings = await executor.preprocess(source)
+            _observe(timings)
+            return index, name, image, None
+        except Exception as e:
+            return index, name, None, str(e)
+
+    async def run_chunk(chunk):
+        ids = [f"{batch_id}-{index}" if batch_id else None for index, _, _ in chunk]
+        try:
+            outputs, timings = await executor.predict_batch(np.stack([image for _, _, image in chunk]), ids, models)
+        except Exception as e:
+            return [(index, name, None, f"X-Ray analysis error: {e}") for index, name, _ in chunk]
+        start   = time.perf_counter()
+        records = analyzer.interpret_batch(outputs, [confidence_threshold] * len(chunk), ids, models)
+        timings["postprocess"] = time.perf_counter() - start
+        _observe(timings)
+
+        logger.info("Batch chunk complete", extra={
+            "batch_id": batch_id, "images": len(chunk), "timings_ms": _timings_ms(timings),
+        })
+        return [(index, name, record, None) for (index, name, _), record in zip(chunk, records)]
+
+    chunk_size = max(1, XRAY_BATCH_CHUNK_SIZE)
+    chunk = []
+    for task in asyncio.as_completed([prepare(i, name, source) for i, (name, source) in enumerate(items)]):
+        index, name, image, error = await task
+        if error is not None:
+            yield index, name, None, error
+            continue
+        chunk.append((index, name, image))
+        if len(chunk) == chunk_size:
+            for result in await run_chunk(chunk):
+                yield result
+            chunk = []
+
+    if chunk:
+        for result in await run_chunk(chunk):
+            yield result
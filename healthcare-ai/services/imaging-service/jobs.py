@@ -0,0 +1,226 @@
+import time
+import uuid
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUEUED    = "queued"
+RUNNING   = "running"
+DONE      = "done"
+FAILED    = "failed"
+CANCELLED = "cancelled"
+EXPIRED   = "expired"
+FINISHED  = (DONE, FAILED, CANCELLED, EXPIRED)
+
+
+class QueueFull(RuntimeError):
+    def __init__(self, retry_after: int):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, work, priority: int, cleanup=None):
+        self.id         = str(uuid.uuid4())[:8]
+        self.priority   = priority
+        self.seq        = 0
+        self.status     = QUEUED
+        self.result     = None
+        self.error      = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.last_seen  = time.monotonic()
+        self._work      = work
+        self._cleanup   = cleanup
+        self._done      = asyncio.Event()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def to_dict(self, position: int = None) -> dict:
+        data = {"job_id": self.id, "status": self.status, "priority": self.priority}
+        if position is not None:
+            data["position"] = position
+        if self.status == DONE:
+            data["result"] = self.result
+        elif self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded priority queue of analysis jobs drained by a fixed set of asyncio workers.
+
+    Lower priority values run first; equal priorities run in submission
+    order. Submitting to a full queue raises QueueFull with a Retry-After
+    estimate instead of waiting. A queued job whose client has not polled
+    for lease_seconds is treated as abandoned and is dropped before it
+    reaches the model. Finished jobs are kept for result_ttl seconds.
+
+    Only jobs still waiting to run count toward max_queued. A cancelled job
+    frees its slot at once; its queue entry is skipped when a worker pops it.
+    """
+
+    def __init__(self, max_queued: int = 64, workers: int = 4, lease_seconds: float = 60.0,
+                 result_ttl: float = 300.0, max_jobs: int = 10000):
+        self.max_queued    = max(1, int(max_queued))
+        self.workers       = max(1, int(workers))
+        self.lease_seconds = float(lease_seconds)
+        self.result_ttl    = float(result_ttl)
+        self.max_jobs      = max(self.max_queued, int(max_jobs))
+        self._jobs         = OrderedDict()
+        self._queue        = None
+        self._pending      = 0
+        self._tasks        = []
+        self._seq          = itertools.count()
+        self._avg_seconds  = None
+        self.completed     = 0
+        self.failed        = 0
+        self.rejected      = 0
+        self.abandoned     = 0
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"xray-job-{i}") for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Cancelling a worker interrupts its job mid-run; both those and the
+        # jobs still queued are finished here so their uploads are closed.
+        for job in list(self._jobs.values()):
+            if job.status in (QUEUED, RUNNING):
+                self._finish(job, CANCELLED, error="Service shutting down")
+
+    # ── Client side ───────────────────────────────────────────────────────────
+
+    def submit(self, work, priority: int = 5, cleanup=None) -> Job:
+        """Queue work, an async callable taking the job and returning its result payload."""
+        self.start()
+        self._purge()
+        if self._pending >= self.max_queued:
+            self.rejected += 1
+            if cleanup is not None:
+                cleanup()
+            raise QueueFull(self.retry_after())
+        job = Job(work, priority, cleanup)
+        job.seq = next(self._seq)
+        self._queue.put_nowait((priority, job.seq, job))
+        self._pending += 1
+        self._jobs[job.id] = job
+        return job
+
+    def ensure_capacity(self):
+        """Raise QueueFull now, before the caller spends time reading an upload."""
+        if self._pending >= self.max_queued:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.touch()
+        return job
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        if timeout > 0 and job.status not in FINISHED:
+            try:
+                await asyncio.wait_for(job._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        job.touch()
+        return job
+
+    def cancel(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None and job.status == QUEUED:
+            self._finish(job, CANCELLED, error="Cancelled by client")
+        return job
+
+    def position(self, job: Job):
+        """1-based place in line for a queued job; an O(n) scan over a small bounded queue."""
+        if job.status != QUEUED:
+            return None
+        ahead = sum(1 for other in self._jobs.values()
+                    if other.status == QUEUED and (other.priority, other.seq) < (job.priority, job.seq))
+        return ahead + 1
+
+    def retry_after(self) -> int:
+        per_job = self._avg_seconds or 1.0
+        return max(1, int(round(per_job * self._pending / self.workers)))
+
+    # ── Worker side ───────────────────────────────────────────────────────────
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        if job.status != QUEUED:
+            return
+        if time.monotonic() - job.last_seen > self.lease_seconds:
+            self.abandoned += 1
+            self._finish(job, EXPIRED, error="No client polled for this job; it was dropped before analysis")
+            return
+
+        self._pending -= 1
+        job.status = RUNNING
+        start = time.perf_counter()
+        try:
+            result = await job._work(job)
+        except Exception as e:
+            self.failed += 1
+            self._finish(job, FAILED, error=str(e))
+            logger.warning("Job failed", extra={"job_id": job.id, "error": str(e)})
+            return
+
+        elapsed = time.perf_counter() - start
+        self._avg_seconds = elapsed if self._avg_seconds is None else 0.9 * self._avg_seconds + 0.1 * elapsed
+        self.completed += 1
+        self._finish(job, DONE, result=result)
+
+    def _finish(self, job: Job, status: str, result=None, error=None):
+        if job.status == QUEUED:
+            self._pending -= 1
+        job.status      = status
+        job.result      = result
+        job.error       = error
+        job.finished_at = time.time()
+        job._work       = None
+        if job._cleanup is not None:
+            job._cleanup()
+            job._cleanup = None
+        job._done.set()
+
+    def _purge(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            expired = job.finished_at is not None and now - job.finished_at > self.result_ttl
+            if expired or (len(self._jobs) > self.max_jobs and job.status in FINISHED):
+                del self._jobs[job_id]
+
+    def get_stats(self) -> dict:
+        return {
+            "workers":      self.workers,
+            "queued":       self._pending,
+            "max_queued":   self.max_queued,
+            "running":      sum(1 for job in self._jobs.values() if job.status == RUNNING),
+            "completed":    self.completed,
+            "failed":       self.failed,
+            "rejected":     self.rejected,
+            "abandoned":    self.abandoned,
+            "avg_seconds":  round(self._avg_seconds, 3) if self._avg_seconds is not None else None,
+        }
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+# XRAY_DEBUG=1 is kept as a shorthand for XRAY_LOG_LEVEL=DEBUG.
+XRAY_LOG_LEVEL  = os.getenv("XRAY_LOG_LEVEL") or ("DEBUG" if os.getenv("XRAY_DEBUG", "0") == "1" else "INFO")
+XRAY_LOG_FORMAT = os.getenv("XRAY_LOG_FORMAT", "json")
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+# Libraries that are chatty at DEBUG and would drown out the service's own records.
+_QUIET_LOGGERS = ("PIL", "asyncio", "multipart", "urllib3")
+
+_listener = None
+_handler  = None
+_pid      = None
+
+
+def _extras(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts":     datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level":  record.levelname,
+            "logger": record.name,
+            "msg":    record.getMessage(),
+            **_extras(record),
+        }
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as key=value pairs."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line   = super().format(record)
+        extras = " ".join(f"{k}={v}" for k, v in _extras(record).items())
+        return f"{line} {extras}" if extras else line
+
+
+def configure_logging(level: str = XRAY_LOG_LEVEL, fmt: str = XRAY_LOG_FORMAT):
+    """Send this process's log records through a queue to a background writer thread.
+
+    Request threads only enqueue records; formatting and the write to stdout
+    happen on the listener thread. Safe to call again in a forked child,
+    which needs its own listener because threads do not survive fork.
+    """
+    global _listener, _handler, _pid
+    if _pid == os.getpid():
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    records = queue.SimpleQueue()
+    root    = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler  = logging.handlers.QueueHandler(records)
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=False)
+    root.addHandler(_handler)
+    root.setLevel(level.upper())
+    for name in _QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
+    _listener.start()
+    _pid = os.getpid()
+
+
+def _stop():
+    if _listener is not None and _pid == os.getpid():
+        _listener.stop()
+
+
+atexit.register(_stop)
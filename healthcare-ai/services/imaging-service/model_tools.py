@@ -0,0 +1,164 @@
+"""Export the X-ray model to alternative backends and check they agree.
+
+    python model_tools.py export --format onnx
+    python model_tools.py export --format onnx --models nih chex
+    python model_tools.py parity --atol 1e-4
+    python model_tools.py variants --variants quantized channels_last
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(current_dir, 'models', 'xray_model'))
+
+import numpy as np
+import torch
+
+from logs import configure_logging
+from backends import BACKENDS, VARIANTS, default_artifact_path, export_onnx, export_torchscript
+from model_loader import MODEL_CATALOG, XRayModelLoader
+from nih_processor import NIHProcessor
+
+SAMPLE_IMAGES = os.path.join(current_dir, '..', '..', 'Data', 'Images')
+EXPORTERS     = {"torchscript": export_torchscript, "onnx": export_onnx}
+
+
+def load_samples(image_dir: str):
+    processor = NIHProcessor()
+    paths     = sorted(glob.glob(os.path.join(image_dir, '*')))
+    if not paths:
+        raise SystemExit(f"No sample images found in {image_dir}")
+    tensors = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            tensors.append(processor.preprocess_image(f))
+    return [os.path.basename(p) for p in paths], torch.cat(tensors)
+
+
+def load(backend: str, model_path: str = None, variants=(), model: str = "nih") -> XRayModelLoader:
+    loader = XRayModelLoader(backend, model_path, variants, MODEL_CATALOG[model]["weights"])
+    if not loader.load_model():
+        raise SystemExit(f"Could not load the '{backend}' backend")
+    return loader
+
+
+def run(loader: XRayModelLoader, images, repeat: int):
+    """Per-image outputs plus mean latency in ms, one image per forward pass."""
+    with torch.no_grad():
+        outputs = np.concatenate([loader.model(images[i:i + 1]).numpy() for i in range(len(images))])
+        start   = time.perf_counter()
+        for _ in range(repeat):
+            for i in range(len(images)):
+                loader.model(images[i:i + 1])
+    return outputs, (time.perf_counter() - start) / (repeat * len(images)) * 1000
+
+
+def cmd_export(args):
+    formats = list(EXPORTERS) if args.format == "all" else [args.format]
+    single  = len(formats) == 1 and len(args.models) == 1
+    for model_id in args.models:
+        model = load("torch", model=model_id).torch_model
+        for fmt in formats:
+            path = args.output if args.output and single else default_artifact_path(fmt, MODEL_CATALOG[model_id]["weights"])
+            start = time.perf_counter()
+            EXPORTERS[fmt](model, path)
+            print(f"Exported {model_id} {fmt} model to {path} in {time.perf_counter() - start:.1f}s")
+
+
+def cmd_parity(args):
+    names, images = load_samples(args.images)
+    print(f"Comparing backends on {len(names)} images from {args.images}")
+
+    baseline = None
+    failed   = False
+    for backend in args.backends:
+        try:
+            loader = load(backend)
+        except SystemExit as e:
+            print(f"  {backend:<12} skipped: {e}")
+            continue
+
+        outputs, latency = run(loader, images, args.repeat)
+
+        if baseline is None:
+            baseline = outputs
+            print(f"  {backend:<12} baseline          {latency:7.1f} ms/image")
+            continue
+
+        diff = float(np.abs(outputs - baseline).max())
+        ok   = diff <= args.atol
+        failed |= not ok
+        print(f"  {backend:<12} max |diff| {diff:.2e}  {latency:7.1f} ms/image  {'OK' if ok else 'MISMATCH'}")
+
+    sys.exit(1 if failed else 0)
+
+
+def cmd_variants(args):
+    names, images = load_samples(args.images)
+    processor     = NIHProcessor()
+
+    def flagged(loader, outputs):
+        return [{f['pathology'] for f in row}
+                for row in processor.interpret_nih_batch(outputs, loader.pathologies, args.threshold)]
+
+    baseline_loader              = load("torch")
+    baseline, baseline_latency   = run(baseline_loader, images, args.repeat)
+    baseline_findings            = flagged(baseline_loader, baseline)
+    print(f"Comparing variants against fp32 on {len(names)} images (threshold {args.threshold})")
+    print(f"  {'fp32':<40} {baseline_latency:7.1f} ms/image")
+
+    candidates = [(v,) for v in args.variants]
+    if len(args.variants) > 1:
+        candidates.append(tuple(args.variants))
+
+    failed = False
+    for variants in candidates:
+        loader           = load("torch", variants=variants)
+        outputs, latency = run(loader, images, args.repeat)
+        findings         = flagged(loader, outputs)
+        changed = [name for name, a, b in zip(names, baseline_findings, findings) if a != b]
+        diff    = float(np.abs(outputs - baseline).max())
+        ok      = not changed and diff <= args.atol
+        failed |= not ok
+        label   = "+".join(variants)
+        print(f"  {label:<40} {latency:7.1f} ms/image  max |diff| {diff:.2e}  "
+              f"{'OK' if ok else 'MISMATCH'}{' on ' + ', '.join(changed) if changed else ''}")
+
+    sys.exit(1 if failed else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub    = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export DenseNet weight sets to TorchScript and/or ONNX")
+    export.add_argument("--format", choices=[*EXPORTERS, "all"], default="all")
+    export.add_argument("--models", nargs="+", choices=list(MODEL_CATALOG), default=["nih"])
+    export.add_argument("--output", help="Output path (single format and model only)")
+    export.set_defaults(func=cmd_export)
+
+    parity = sub.add_parser("parity", help="Check every backend returns the same 18 probabilities")
+    parity.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parity.add_argument("--images", default=SAMPLE_IMAGES)
+    parity.add_argument("--atol", type=float, default=1e-4)
+    parity.add_argument("--repeat", type=int, default=3)
+    parity.set_defaults(func=cmd_parity)
+
+    variants = sub.add_parser("variants", help="Check optimized model variants against the fp32 baseline")
+    variants.add_argument("--variants", nargs="+", choices=VARIANTS, default=["quantized", "channels_last", "inference_mode"])
+    variants.add_argument("--images", default=SAMPLE_IMAGES)
+    variants.add_argument("--threshold", type=float, default=0.5)
+    variants.add_argument("--atol", type=float, default=1e-2)
+    variants.add_argument("--repeat", type=int, default=3)
+    variants.set_defaults(func=cmd_variants)
+
+    args = parser.parse_args()
+    configure_logging(fmt="text")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
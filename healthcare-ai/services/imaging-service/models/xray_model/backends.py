@@ -0,0 +1,168 @@
+import os
+import inspect
+import logging
+import warnings
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "torchscript", "onnx")
+VARIANTS = ("quantized", "channels_last", "inference_mode", "compile")
+
+ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exported")
+ARTIFACT_EXT = {"torchscript": ".pt", "onnx": ".onnx"}
+
+
+def default_artifact_path(backend: str, weights: str) -> str:
+    return os.path.join(ARTIFACT_DIR, f"{weights}{ARTIFACT_EXT[backend]}")
+
+
+def _example_input(batch_size: int = 2):
+    # Spread over the model's [-1024, 1024] input range so tracing does not
+    # trip torchxrayvision's normalization warning.
+    return torch.rand(batch_size, 1, 224, 224) * 2048 - 1024
+
+
+class TorchBackend:
+    """Eager PyTorch module, optionally with CPU-oriented variants applied.
+
+    quantized       int8 dynamic quantization of the Linear layers
+    channels_last   NHWC memory format for the convolutions
+    inference_mode  torch.inference_mode() instead of the caller's no_grad()
+    compile         torch.compile(), when this torch build provides it
+    """
+
+    name = "torch"
+
+    def __init__(self, model, variants=()):
+        unknown = set(variants) - set(VARIANTS)
+        if unknown:
+            raise ValueError(f"Unknown model variant(s): {', '.join(sorted(unknown))}. "
+                             f"Expected any of: {', '.join(VARIANTS)}")
+
+        self.variants      = tuple(v for v in VARIANTS if v in variants)
+        self.channels_last = "channels_last" in self.variants
+        self.model         = model
+
+        if "quantized" in self.variants:
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        if "compile" in self.variants:
+            if hasattr(torch, "compile"):
+                self.model = torch.compile(self.model, dynamic=True)
+            else:
+                logger.warning("torch.compile is not available in this torch build; serving uncompiled model")
+                self.variants = tuple(v for v in self.variants if v != "compile")
+
+    def __call__(self, tensor):
+        if self.channels_last:
+            tensor = tensor.contiguous(memory_format=torch.channels_last)
+        if "inference_mode" in self.variants:
+            with torch.inference_mode():
+                return self.model(tensor)
+        return self.model(tensor)
+
+    def share_memory(self):
+        self.model.share_memory()
+
+
+class TorchScriptBackend:
+    """Traced and frozen TorchScript graph, loaded from disk or traced at startup."""
+
+    name = "torchscript"
+
+    def __init__(self, model, path: str = None):
+        if path and os.path.exists(path):
+            logger.info("Loading TorchScript model", extra={"path": path})
+            self.model = torch.jit.load(path, map_location="cpu")
+        else:
+            logger.info("Tracing TorchScript model from the eager weights")
+            self.model = trace_torchscript(model)
+        self.model.eval()
+
+    def __call__(self, tensor):
+        return self.model(tensor)
+
+    def share_memory(self):
+        self.model.share_memory()
+
+
+class OnnxBackend:
+    """Exported ONNX graph run through ONNX Runtime on CPU.
+
+    The session is created on first use in each process, after the executor
+    has set the torch thread count, so forked or spawned workers never
+    inherit a session whose thread pool belongs to another process.
+    """
+
+    name = "onnx"
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {path}. Run `python model_tools.py export --format onnx` first."
+            )
+        import onnxruntime  # noqa: F401  (fail at load time, not on the first request)
+        self.path     = path
+        self._session = None
+        self._pid     = None
+
+    def _get_session(self):
+        if self._session is None or self._pid != os.getpid():
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads     = torch.get_num_threads()
+            self._session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+            self._pid     = os.getpid()
+        return self._session
+
+    def __call__(self, tensor):
+        outputs = self._get_session().run(None, {"image": tensor.detach().cpu().numpy()})[0]
+        return torch.from_numpy(outputs)
+
+    def share_memory(self):
+        pass
+
+
+def trace_torchscript(model):
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter("ignore")
+        traced = torch.jit.trace(model.eval(), _example_input(), check_trace=False)
+    return torch.jit.freeze(traced)
+
+
+def export_torchscript(model, path: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    trace_torchscript(model).save(path)
+    return path
+
+
+def export_onnx(model, path: str, opset: int = 17) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter("ignore")
+        torch.onnx.export(
+            model.eval(), (_example_input(),), path,
+            input_names=["image"],
+            output_names=["probabilities"],
+            dynamic_axes={"image": {0: "batch"}, "probabilities": {0: "batch"}},
+            opset_version=opset,
+            **kwargs,
+        )
+    return path
+
+
+def create_backend(name: str, model, path: str = None, variants=()):
+    if variants and name != "torch":
+        raise ValueError(f"Model variants ({', '.join(variants)}) are only supported by the torch backend")
+    if name == "torch":
+        return TorchBackend(model, variants)
+    if name == "torchscript":
+        return TorchScriptBackend(model, path)
+    if name == "onnx":
+        return OnnxBackend(path)
+    raise ValueError(f"Unknown inference backend '{name}'. Expected one of: {', '.join(BACKENDS)}")
@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+
+class InferenceBatcher:
+    """Collects single-image forward passes and runs them as one batch."""
+
+    def __init__(self, model, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        self.model          = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait       = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue         = queue.Queue()
+        self._lock          = threading.Lock()
+        self._thread        = None
+        self.batches_run    = 0
+        self.images_run     = 0
+
+    def submit(self, tensor) -> Future:
+        """Queue a [1, C, H, W] tensor; the future resolves to its row of outputs.
+
+        A model that returns a tuple of batched tensors resolves to a tuple of rows.
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((tensor, future))
+        return future
+
+    def predict(self, tensor):
+        return self.submit(tensor).result()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="xray-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch    = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch   = self._collect()
+            pending = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            try:
+                inputs = torch.cat([t for t, _ in pending], dim=0)
+                with torch.no_grad():
+                    outputs = self.model(inputs)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.images_run  += len(pending)
+            for i, (_, future) in enumerate(pending):
+                future.set_result(tuple(o[i] for o in outputs) if isinstance(outputs, tuple) else outputs[i])
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled":        True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms":    self.max_wait * 1000.0,
+            "queued":         self._queue.qsize(),
+            "batches_run":    self.batches_run,
+            "images_run":     self.images_run,
+            "avg_batch_size": round(self.images_run / self.batches_run, 2) if self.batches_run else 0.0,
+        }
@@ -0,0 +1,147 @@
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+try:
+    import pydicom
+    from pydicom.pixels import pixel_array
+except ImportError:  # optional: only needed for DICOM uploads
+    pydicom = None
+
+# A DICOM file starts with a 128-byte preamble followed by "DICM".
+DICOM_MAGIC        = b"DICM"
+DICOM_MAGIC_OFFSET = 128
+PIXEL_DATA         = 0x7FE00010
+
+# Frames are block-averaged down to about this size before resampling, like
+# the JPEG draft decode in the fast preprocessing path.
+DRAFT_SIZE = 448
+
+
+def is_dicom(head: bytes) -> bool:
+    return head[DICOM_MAGIC_OFFSET:DICOM_MAGIC_OFFSET + len(DICOM_MAGIC)] == DICOM_MAGIC
+
+
+def read_dicom(image_file, size: int = 224, timings=None) -> np.ndarray:
+    """First frame of a DICOM file as a [size, size] float32 array in the model's [-1024, 1024] range.
+
+    Only the header is parsed up front. Uncompressed pixel data is then read
+    in place, memory-mapped when the upload is on disk, and only the first
+    frame of a multi-frame file is touched; compressed transfer syntaxes are
+    decoded one frame at a time by pydicom. The frame is block-averaged and
+    resampled while still holding stored values, and the modality rescale,
+    VOI window, MONOCHROME1 inversion and scaling to [-1024, 1024] are then
+    applied together as one affine transform and clip on the small result.
+    """
+    if pydicom is None:
+        raise RuntimeError("DICOM input needs pydicom: pip install pydicom")
+
+    start = time.perf_counter()
+    image_file.seek(0)
+    ds    = pydicom.dcmread(image_file, defer_size=1024)
+    frame = _first_frame(ds, image_file)
+
+    # Stored values still, so only the averaging below reads the full frame.
+    k = max(1, min(frame.shape) // DRAFT_SIZE)
+    if k > 1:
+        h, w  = frame.shape[0] // k, frame.shape[1] // k
+        small = frame[:h * k, :w * k].reshape(h, k, w, k).mean(axis=(1, 3), dtype=np.float32)
+    else:
+        small = np.asarray(frame, dtype=np.float32)
+    del frame
+    decoded = time.perf_counter()
+
+    resized = np.array(Image.fromarray(small, mode="F").resize((size, size)), dtype=np.float32)
+    scale, offset = _intensity_transform(ds, resized)
+    np.multiply(resized, np.float32(scale), out=resized)
+    resized += np.float32(offset)
+    np.clip(resized, -1024, 1024, out=resized)
+
+    if timings is not None:
+        timings["decode"]     = decoded - start
+        timings["preprocess"] = time.perf_counter() - decoded
+    return resized
+
+
+def _first_frame(ds, image_file) -> np.ndarray:
+    samples = int(ds.get("SamplesPerPixel", 1))
+    # keep_deferred returns the raw element, so the pixel data is not read here.
+    element = ds.get_item(PIXEL_DATA, keep_deferred=True)
+    if element is None:
+        raise ValueError("DICOM file has no pixel data")
+
+    syntax = ds.file_meta.TransferSyntaxUID
+    if syntax.is_compressed or samples != 1 or int(ds.BitsAllocated) not in (8, 16, 32):
+        image_file.seek(0)
+        frame = pixel_array(image_file, index=0)
+        return frame.mean(axis=-1) if frame.ndim == 3 else frame
+
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    signed     = int(ds.get("PixelRepresentation", 0)) == 1
+    dtype      = np.dtype(f"{'<' if syntax.is_little_endian else '>'}{'i' if signed else 'u'}{int(ds.BitsAllocated) // 8}")
+    offset     = element.value_tell
+    count      = rows * cols
+
+    if _on_disk(image_file):
+        pixels = np.memmap(image_file, dtype, mode="r", offset=offset, shape=(count,))
+    else:
+        image_file.seek(offset)
+        pixels = np.frombuffer(image_file.read(count * dtype.itemsize), dtype)
+    if pixels.size < count:
+        raise ValueError("DICOM pixel data is truncated")
+
+    return pixels.reshape(rows, cols)
+
+
+def _on_disk(image_file) -> bool:
+    # Calling fileno() on a SpooledTemporaryFile still held in memory would
+    # force it to disk. Until it spills its name is None, as it is for any
+    # in-memory buffer, so only named files are asked for a descriptor.
+    if getattr(image_file, "name", None) is None:
+        return False
+    try:
+        image_file.fileno()
+        return True
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return False
+
+
+def _intensity_transform(ds, stored: np.ndarray):
+    """(scale, offset) taking stored values to the model range in one step.
+
+    Modality rescale, the linear VOI window from the file (or the image's own
+    range if there is none), MONOCHROME1 inversion and the final mapping to
+    [-1024, 1024] are all affine, so they fold into a single multiply-add.
+    """
+    slope     = float(ds.get("RescaleSlope", 1) or 1)
+    intercept = float(ds.get("RescaleIntercept", 0) or 0)
+
+    center, width = _window(ds)
+    if center is not None:
+        # DICOM PS3.3 C.11.2.1.2 linear window: y = (x - (c - 0.5)) / (w - 1) + 0.5
+        span = max(width - 1.0, 1.0)
+        low  = center - 0.5 - span / 2
+    else:
+        values    = stored * slope + intercept
+        low, high = float(values.min()), float(values.max())
+        span      = max(high - low, 1e-6)
+
+    scale  = 2048.0 * slope / span
+    offset = 2048.0 * (intercept - low) / span - 1024.0
+    if str(ds.get("PhotometricInterpretation", "MONOCHROME2")).strip() == "MONOCHROME1":
+        scale, offset = -scale, -offset
+    return scale, offset
+
+
+def _window(ds):
+    center, width = ds.get("WindowCenter"), ds.get("WindowWidth")
+    if center is None or width is None:
+        return None, None
+    # Either may be multi-valued; the first pair is the default view.
+    center = center[0] if isinstance(center, pydicom.multival.MultiValue) else center
+    width  = width[0] if isinstance(width, pydicom.multival.MultiValue) else width
+    if float(width) <= 0:
+        return None, None
+    return float(center), float(width)
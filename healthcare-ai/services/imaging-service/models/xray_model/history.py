@@ -0,0 +1,182 @@
+import json
+import queue
+import logging
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _epoch(moment: datetime) -> float:
+    # Naive datetimes are UTC, matching the timestamps the service reports.
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def overall_risk(findings: list) -> str:
+    severities = {f["severity"] for f in findings}
+    if "high" in severities:
+        return "high"
+    if "medium" in severities:
+        return "medium"
+    return "low"
+
+
+class AnalysisHistory:
+    """Bounded in-memory ring buffer of analyses, optionally mirrored to SQLite.
+
+    Memory use is capped at max_records no matter how long the process runs.
+    When db_path is set, every record is also appended to an on-disk table by
+    a background writer thread; that table keeps at most max_db_rows rows.
+    The writer has its own connection and shares no lock with add() or the
+    readers, which query through a second connection; in WAL mode neither
+    waits on the other's disk I/O.
+    """
+
+    def __init__(self, max_records: int = 1000, db_path: str = None, max_db_rows: int = 100000):
+        self._records    = deque(maxlen=max(1, int(max_records)))
+        self._lock       = threading.Lock()     # guards _records only
+        self._db_lock    = threading.Lock()     # serializes use of the read connection
+        self.db_path     = db_path
+        self.max_db_rows = int(max_db_rows)
+        self._db         = None
+        self._writer     = None
+        self._pending    = None
+        if db_path:
+            self._open_db()
+
+    # ── Writing ───────────────────────────────────────────────────────────────
+
+    def add(self, record: dict) -> dict:
+        now   = datetime.utcnow()
+        ts    = _epoch(now)
+        entry = {
+            **record,
+            "timestamp":  now.isoformat(),
+            "risk_level": overall_risk(record.get("findings", [])),
+        }
+        with self._lock:
+            self._records.append((ts, entry))
+        if self._pending is not None:
+            self._pending.put((ts, entry))
+        return entry
+
+    def clear(self):
+        """Drop the in-memory records. The on-disk store is append-only and is kept."""
+        with self._lock:
+            self._records.clear()
+
+    # ── Reading ───────────────────────────────────────────────────────────────
+
+    def recent(self) -> list:
+        with self._lock:
+            return [entry for _, entry in self._records]
+
+    def get(self, analysis_id: str):
+        with self._lock:
+            for _, entry in reversed(self._records):
+                if entry["analysis_id"] == analysis_id:
+                    return entry
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT record FROM analyses WHERE analysis_id = ? ORDER BY created_at DESC LIMIT 1",
+                (analysis_id,),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, since: datetime = None, until: datetime = None, risk_level: str = None,
+              limit: int = 50, offset: int = 0) -> dict:
+        """Newest-first page of analyses filtered by time range and risk level."""
+        since_ts = _epoch(since) if since else None
+        until_ts = _epoch(until) if until else None
+
+        if self._db is not None:
+            return self._query_db(since_ts, until_ts, risk_level, limit, offset)
+
+        with self._lock:
+            matches = [
+                entry for ts, entry in reversed(self._records)
+                if (since_ts is None or ts >= since_ts)
+                and (until_ts is None or ts <= until_ts)
+                and (risk_level is None or entry["risk_level"] == risk_level)
+            ]
+        return {"total": len(matches), "limit": limit, "offset": offset,
+                "results": matches[offset:offset + limit]}
+
+    def get_stats(self) -> dict:
+        return {
+            "in_memory":   len(self._records),
+            "max_records": self._records.maxlen,
+            "db_path":     self.db_path,
+            "db_pending":  self._pending.qsize() if self._pending is not None else 0,
+        }
+
+    # ── SQLite store ──────────────────────────────────────────────────────────
+
+    def _open_db(self):
+        self._writer = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " analysis_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " risk_level TEXT NOT NULL,"
+            " record TEXT NOT NULL)"
+        )
+        self._writer.execute("CREATE INDEX IF NOT EXISTS idx_analyses_id ON analyses (analysis_id)")
+        self._writer.execute("CREATE INDEX IF NOT EXISTS idx_analyses_time ON analyses (created_at)")
+        self._writer.commit()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+
+        self._pending = queue.Queue()
+        threading.Thread(target=self._write_loop, name="xray-history", daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            rows = [self._pending.get()]
+            while True:
+                try:
+                    rows.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._writer.executemany(
+                    "INSERT INTO analyses (analysis_id, created_at, risk_level, record) VALUES (?, ?, ?, ?)",
+                    [(e["analysis_id"], ts, e["risk_level"], json.dumps(e, ensure_ascii=False)) for ts, e in rows],
+                )
+                if self.max_db_rows > 0:
+                    self._writer.execute(
+                        "DELETE FROM analyses WHERE id <= (SELECT MAX(id) FROM analyses) - ?",
+                        (self.max_db_rows,),
+                    )
+                self._writer.commit()
+            except Exception as e:
+                logger.error("Analysis history write failed", extra={"error": str(e), "rows": len(rows)})
+
+    def _query_db(self, since_ts, until_ts, risk_level, limit, offset) -> dict:
+        clauses, params = [], []
+        if since_ts is not None:
+            clauses.append("created_at >= ?")
+            params.append(since_ts)
+        if until_ts is not None:
+            clauses.append("created_at <= ?")
+            params.append(until_ts)
+        if risk_level is not None:
+            clauses.append("risk_level = ?")
+            params.append(risk_level)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._db_lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM analyses{where}", params).fetchone()[0]
+            rows  = self._db.execute(
+                f"SELECT record FROM analyses{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return {"total": total, "limit": limit, "offset": offset,
+                "results": [json.loads(row[0]) for row in rows]}
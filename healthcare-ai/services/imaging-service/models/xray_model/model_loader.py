@@ -1,33 +1,87 @@
+import os
+import logging
 import torch
 import torchxrayvision as xrv
+from backends import create_backend, default_artifact_path
+
+NIH_WEIGHTS = "densenet121-res224-nih"
+
+# torchxrayvision DenseNet-121 weight sets the service can host, keyed by the
+# id clients pass as `model`. Every one of them emits the same 18 columns in
+# xrv.datasets.default_pathologies order; labels a set was not trained on are
+# left blank.
+MODEL_CATALOG = {
+    "nih":      {"weights": NIH_WEIGHTS,                  "training_data": "NIH ChestX-ray14"},
+    "chex":     {"weights": "densenet121-res224-chex",     "training_data": "CheXpert"},
+    "mimic_nb": {"weights": "densenet121-res224-mimic_nb", "training_data": "MIMIC-CXR (NegBio labels)"},
+    "mimic_ch": {"weights": "densenet121-res224-mimic_ch", "training_data": "MIMIC-CXR (CheXpert labels)"},
+    "pc":       {"weights": "densenet121-res224-pc",       "training_data": "PadChest"},
+    "rsna":     {"weights": "densenet121-res224-rsna",     "training_data": "RSNA Pneumonia Challenge"},
+    "all":      {"weights": "densenet121-res224-all",      "training_data": "NIH, CheXpert, MIMIC-CXR, PadChest, RSNA, OpenI and Google combined"},
+}
+
+logger = logging.getLogger(__name__)
 
 class XRayModelLoader:
-    def __init__(self):
+    def __init__(self, backend: str = "torch", model_path: str = None, variants=(), weights: str = NIH_WEIGHTS):
         self.model = None
+        self.torch_model = None
+        self.backend = backend
+        self.model_path = model_path
+        self.variants = tuple(variants)
+        self.weights = weights
         self.pathologies = []
-    
-    def load_nih_model(self):
+
+    def load_model(self):
         try:
-            print("Loading NIH-trained medical AI model...")
-            self.model = xrv.models.DenseNet(weights="densenet121-res224-nih")
-            self.model.eval()
-            self.pathologies = self.model.pathologies
+            logger.info("Loading medical AI model",
+                        extra={"weights": self.weights, "backend": self.backend, "variants": list(self.variants)})
+            self.torch_model = xrv.models.DenseNet(weights=self.weights)
+            self.torch_model.eval()
+            self.pathologies = self.torch_model.pathologies
+
+            path = self.model_path
+            if path is None and self.backend != "torch":
+                path = default_artifact_path(self.backend, self.weights)
+            self.model = create_backend(self.backend, self.torch_model, path, self.variants)
+            self.variants = getattr(self.model, "variants", ())
             return True
         except Exception as e:
-            print(f"Model loading failed: {e}")
+            logger.exception("Model loading failed", extra={"weights": self.weights})
             return False
-    
+
+    def share_memory(self):
+        self.torch_model.share_memory()
+        self.model.share_memory()
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size: the eager weights plus any exported artifact served alongside them."""
+        if self.torch_model is None:
+            return 0
+        tensors = list(self.torch_model.parameters()) + list(self.torch_model.buffers())
+        size    = sum(t.numel() * t.element_size() for t in tensors)
+        path    = getattr(self.model, "path", None)
+        if path and os.path.exists(path):
+            size += os.path.getsize(path)
+        elif self.backend == "torchscript":
+            size *= 2
+        return size
+
     def get_model_info(self):
         if self.model is None:
             return "No model loaded"
-        
+
+        training_data = next((m["training_data"] for m in MODEL_CATALOG.values() if m["weights"] == self.weights), None)
         return {
             "model_type": "DenseNet121",
-            "training_data": "NIH ChestX-ray8",
+            "training_data": training_data,
+            "weights": self.weights,
+            "backend": self.backend,
+            "variants": list(self.variants),
             "pathologies": self.pathologies,
             "input_size": (224, 224),
             "pathology_count": len(self.pathologies)
         }
-    
+
     def get_available_pathologies(self):
-        return self.pathologies if self.model else []
\ No newline at end of file
+        return self.pathologies if self.model else []
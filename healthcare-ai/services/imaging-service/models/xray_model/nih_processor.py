@@ -1,96 +1,194 @@
+import time
+import logging
 import torch
 from PIL import Image
 import numpy as np
+from dicom import DICOM_MAGIC, DICOM_MAGIC_OFFSET, is_dicom, read_dicom
+
+NIH_NAME_MAP = {
+    'Atelectasis': 'Atelectasis',
+    'Cardiomegaly': 'Cardiomegaly', 
+    'Consolidation': 'Consolidation',
+    'Edema': 'Edema',
+    'Effusion': 'Effusion',
+    'Emphysema': 'Emphysema',
+    'Fibrosis': 'Fibrosis',
+    'Hernia': 'Hernia',
+    'Infiltration': 'Infiltration',
+    'Mass': 'Mass',
+    'Nodule': 'Nodule',
+    'Pleural_Thickening': 'Pleural Thickening',
+    'Pneumonia': 'Pneumonia',
+    'Pneumothorax': 'Pneumothorax'
+}
+
+HIGH_SEVERITY   = frozenset(['Pneumothorax', 'Edema', 'Consolidation', 'Pneumonia'])
+MEDIUM_SEVERITY = frozenset(['Effusion', 'Mass', 'Cardiomegaly'])
+SEVERITY_LABELS = ('low', 'medium', 'high')
+
+# JPEG draft decoding target: twice the model resolution keeps the fast path
+# within one gray level on average of a full-resolution decode.
+DRAFT_SIZE = 448
+
+logger = logging.getLogger(__name__)
 
 class NIHProcessor:
-    def __init__(self):
+    def __init__(self, fast: bool = False):
+        self.fast = fast
         self.nih_diseases = [
             'Atelectasis', 'Cardiomegaly', 'Effusion', 'Infiltration',
             'Mass', 'Nodule', 'Pneumonia', 'Pneumothorax',
             'Consolidation', 'Edema', 'Emphysema', 'Fibrosis',
             'Pleural_Thickening', 'Hernia'
         ]
+        # Per-pathology-list index arrays, built once per model.
+        self._tables = {}
     
-    def preprocess_image(self, image_file):
+    def preprocess_image(self, image_file, out=None, timings=None):
+        """Decode and normalize one image; timings, if given, receives decode/preprocess seconds."""
         try:
             if hasattr(image_file, 'seek'):
                 image_file.seek(0)
-                
+
+            if self._is_dicom(image_file):
+                return self._preprocess_dicom(image_file, out, timings)
+
+            if self.fast:
+                return self._preprocess_fast(image_file, out, timings)
+
+            start = time.perf_counter()
             img = Image.open(image_file).convert('L')
+            decoded = time.perf_counter()
             img = img.resize((224, 224))
             
             img_array = np.array(img, dtype=np.float32)
-            
-            print(f"🔍 ORIGINAL - Range: {img_array.min()} to {img_array.max()}")
-                            
             img_array = img_array / 255.0
             img_array = img_array * 2048 - 1024  
-            
-            print(f"🔍 MEDICAL NORMALIZED - Range: {img_array.min():.1f} to {img_array.max():.1f}")
-            
             img_array = img_array[None, None, ...]
             
             img_tensor = torch.from_numpy(img_array).float()
             
-            print(f"🔍 FINAL TENSOR - Range: {img_tensor.min():.1f} to {img_tensor.max():.1f}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Preprocessed image", extra={
+                    "path": "default", "min": float(img_array.min()), "max": float(img_array.max()),
+                })
             
+            if timings is not None:
+                timings["decode"]     = decoded - start
+                timings["preprocess"] = time.perf_counter() - decoded
             return img_tensor
                 
         except Exception as e:
-            print(f"Medical preprocessing failed: {e}")
+            logger.warning("Medical preprocessing failed", extra={"error": str(e)})
             raise Exception(f"Image processing failed: {e}")
 
+    def _is_dicom(self, image_file) -> bool:
+        if not hasattr(image_file, 'seek'):
+            return False
+        head = image_file.read(DICOM_MAGIC_OFFSET + len(DICOM_MAGIC))
+        image_file.seek(0)
+        return is_dicom(head)
+
+    def _preprocess_dicom(self, image_file, out=None, timings=None):
+        # Already in the model's range; no 8-bit round trip.
+        if out is None:
+            out = np.empty((1, 1, 224, 224), dtype=np.float32)
+        out[0, 0] = read_dicom(image_file, 224, timings)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Preprocessed image", extra={
+                "path": "dicom", "min": float(out.min()), "max": float(out.max()),
+            })
+        return torch.from_numpy(out)
+
+    def _preprocess_fast(self, image_file, out=None, timings=None):
+        start = time.perf_counter()
+        img = Image.open(image_file)
+        if img.format == 'JPEG':
+            # Let libjpeg decode at a reduced DCT scale and straight to
+            # grayscale instead of inflating the full-resolution image.
+            img.draft('L', (DRAFT_SIZE, DRAFT_SIZE))
+        img = img.convert('L')
+        decoded = time.perf_counter()
+        img = img.resize((224, 224))
+
+        if out is None:
+            out = np.empty((1, 1, 224, 224), dtype=np.float32)
+        np.multiply(np.asarray(img), np.float32(2048 / 255), out=out[0, 0])
+        out -= 1024
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Preprocessed image", extra={
+                "path": "fast", "min": float(out.min()), "max": float(out.max()),
+            })
+
+        if timings is not None:
+            timings["decode"]     = decoded - start
+            timings["preprocess"] = time.perf_counter() - decoded
+        return torch.from_numpy(out)
+
     def interpret_nih_results(self, outputs, pathologies, confidence_threshold=0.5):
-        significant_findings = []
-        
-        for i, pathology in enumerate(pathologies):
-            if not pathology or pathology.strip() == "":
-                continue
-                
-            confidence = float(outputs[i])
-            if confidence > confidence_threshold:
-                nih_name = self.map_to_nih_disease(pathology)
-                significant_findings.append({
-                    'pathology': pathology,
-                    'nih_name': nih_name,
-                    'confidence': confidence,
-                    'confidence_percent': f"{confidence*100:.1f}%",
-                    'severity': self.assess_severity(pathology, confidence)
-                })
-        
-        significant_findings.sort(key=lambda x: x['confidence'], reverse=True)
-        return significant_findings
-    
+        return self.interpret_nih_batch(outputs, pathologies, confidence_threshold)[0]
+
+    def interpret_nih_batch(self, outputs, pathologies, confidence_thresholds=0.5):
+        """Threshold a [batch, n_pathologies] output matrix; one findings list per row.
+
+        confidence_thresholds is a scalar or one threshold per row.
+        """
+        columns, names, nih_names, high, medium = self._lookup_tables(pathologies)
+
+        probs = np.asarray(outputs, dtype=np.float64)
+        if probs.ndim == 1:
+            probs = probs[None, :]
+        probs = probs[:, columns]
+
+        thresholds = np.broadcast_to(np.asarray(confidence_thresholds, dtype=np.float64), (probs.shape[0],))
+        hits       = probs > thresholds[:, None]
+        severity   = np.where(high & (probs > 0.3), 2, np.where(medium & (probs > 0.4), 1, 0))
+        order      = np.argsort(-probs, axis=1, kind="stable")
+
+        results = []
+        for row in range(probs.shape[0]):
+            ranked = order[row][hits[row, order[row]]]
+            results.append([
+                {
+                    'pathology': names[j],
+                    'nih_name': nih_names[j],
+                    'confidence': float(probs[row, j]),
+                    'confidence_percent': f"{probs[row, j]*100:.1f}%",
+                    'severity': SEVERITY_LABELS[severity[row, j]],
+                }
+                for j in ranked
+            ])
+        return results
+
+    def _lookup_tables(self, pathologies):
+        key = tuple(pathologies)
+        tables = self._tables.get(key)
+        if tables is None:
+            columns = [i for i, p in enumerate(key) if p and p.strip() != ""]
+            names   = [key[i] for i in columns]
+            tables  = (
+                np.array(columns, dtype=np.intp),
+                names,
+                [self.map_to_nih_disease(p) for p in names],
+                np.array([p in HIGH_SEVERITY for p in names], dtype=bool),
+                np.array([p in MEDIUM_SEVERITY for p in names], dtype=bool),
+            )
+            self._tables[key] = tables
+        return tables
+
     def map_to_nih_disease(self, pathology):
-        mapping = {
-            'Atelectasis': 'Atelectasis',
-            'Cardiomegaly': 'Cardiomegaly', 
-            'Consolidation': 'Consolidation',
-            'Edema': 'Edema',
-            'Effusion': 'Effusion',
-            'Emphysema': 'Emphysema',
-            'Fibrosis': 'Fibrosis',
-            'Hernia': 'Hernia',
-            'Infiltration': 'Infiltration',
-            'Mass': 'Mass',
-            'Nodule': 'Nodule',
-            'Pleural_Thickening': 'Pleural Thickening',
-            'Pneumonia': 'Pneumonia',
-            'Pneumothorax': 'Pneumothorax'
-        }
-        return mapping.get(pathology, pathology)
-    
+        return NIH_NAME_MAP.get(pathology, pathology)
+
     def assess_severity(self, pathology, confidence):
-        high_severity = ['Pneumothorax', 'Edema', 'Consolidation', 'Pneumonia']
-        medium_severity = ['Effusion', 'Mass', 'Cardiomegaly']
-        
-        if pathology in high_severity and confidence > 0.3:
+        if pathology in HIGH_SEVERITY and confidence > 0.3:
             return 'high'
-        elif pathology in medium_severity and confidence > 0.4:
+        elif pathology in MEDIUM_SEVERITY and confidence > 0.4:
             return 'medium'
         else:
             return 'low'
-    
+
     def generate_recommendations(self, findings):
         high_severity_findings = [f for f in findings if f['severity'] == 'high']
         medium_severity_findings = [f for f in findings if f['severity'] == 'medium']
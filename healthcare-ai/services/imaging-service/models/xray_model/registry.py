@@ -0,0 +1,215 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import torchxrayvision as xrv
+
+from model_loader import MODEL_CATALOG, XRayModelLoader
+
+logger = logging.getLogger(__name__)
+
+ENSEMBLE = "ensemble"
+
+
+class _Entry:
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+        self.weights  = MODEL_CATALOG[model_id]["weights"]
+        self.labels   = list(xrv.models.model_urls[self.weights]["labels"])
+        self.loader   = None
+        self.load_lock = threading.Lock()
+        self.pinned   = False
+        self.in_use   = 0
+        self.size     = 0
+        self.loads    = 0
+        self.uses     = 0
+
+
+class ModelRegistry:
+    """The weight sets one analyzer can serve, loaded on first use and unloaded LRU-first.
+
+    A request names one model, a comma-separated list, or "ensemble" for the
+    configured members. Members of a multi-model request run concurrently on
+    the same preprocessed tensor and their probabilities are averaged per
+    label over the members that were trained on it. The default model is
+    loaded by the analyzer and never unloaded; any other model is dropped,
+    least recently used first, once loading it would push the loaded weights
+    past memory_budget_mb. Models that are mid-forward are never dropped.
+    """
+
+    def __init__(self, models=None, default: str = "nih", ensemble=(), memory_budget_mb: float = 0,
+                 backend: str = "torch", variants=()):
+        ids = list(dict.fromkeys(models or MODEL_CATALOG))
+        if default not in ids:
+            ids.insert(0, default)
+        unknown = [m for m in ids if m not in MODEL_CATALOG]
+        if unknown:
+            raise ValueError(f"Unknown model(s): {', '.join(unknown)}. Expected any of: {', '.join(MODEL_CATALOG)}")
+
+        self.model_ids        = tuple(ids)
+        self.default          = default
+        self.backend          = backend
+        self.variants         = tuple(variants)
+        self.memory_budget_mb = memory_budget_mb
+        self.memory_budget    = int(memory_budget_mb * 1024 * 1024)
+        self._entries         = OrderedDict((m, _Entry(m)) for m in ids)
+        self._lock            = threading.Lock()
+        self._pool            = None
+        self._pool_pid        = None
+        self.evictions        = 0
+        self.ensemble         = self.resolve(",".join(ensemble)) if ensemble else (default,)
+
+    def pin(self, loader: XRayModelLoader):
+        """Register the analyzer's already-loaded default model; it stays resident."""
+        entry = self._entries[self.default]
+        with self._lock:
+            entry.loader = loader
+            entry.pinned = True
+            entry.size   = loader.memory_bytes()
+            entry.loads += 1
+
+    # ── Requests ──────────────────────────────────────────────────────────────
+
+    def resolve(self, model: str = None) -> tuple:
+        """Member ids for a request's `model` value: an id, a comma-separated list, or "ensemble"."""
+        if not model:
+            return (self.default,)
+        if model == ENSEMBLE:
+            return self.ensemble
+        members = tuple(dict.fromkeys(m.strip() for m in model.split(",") if m.strip()))
+        unknown = [m for m in members if m not in self._entries]
+        if unknown or not members:
+            raise ValueError(f"Unknown model '{model}'. Available: {', '.join([*self.model_ids, ENSEMBLE])}")
+        return members
+
+    def key(self, members) -> str:
+        """Canonical name of a member set, used in cache keys and analysis records."""
+        return "+".join(sorted(members))
+
+    def pathologies(self, members) -> list:
+        """Output column labels for a member set: a column is named if any member was trained on it."""
+        labels = [self._entries[m].labels for m in members]
+        return [next((column[i] for column in labels if column[i]), "") for i in range(len(labels[0]))]
+
+    def describe(self, members) -> str:
+        if len(members) == 1:
+            return f"DenseNet-121 / {MODEL_CATALOG[members[0]]['training_data']}"
+        return f"DenseNet-121 ensemble ({', '.join(members)})"
+
+    def predict(self, tensor, members):
+        """[batch, 18] probabilities for a member set, averaged per label across members."""
+        if len(members) == 1:
+            return self._forward(members[0], tensor)
+        futures = [self._get_pool().submit(self._forward, m, tensor) for m in members]
+        outputs = torch.stack([f.result() for f in futures])
+        mask    = torch.tensor([[bool(label) for label in self._entries[m].labels] for m in members],
+                               dtype=outputs.dtype)[:, None, :]
+        count   = mask.sum(dim=0).clamp(min=1)
+        return (outputs * mask).sum(dim=0) / count
+
+    def _forward(self, model_id: str, tensor):
+        with self.acquire(model_id) as loader, torch.no_grad():
+            return loader.model(tensor)
+
+    def _get_pool(self):
+        # Threads do not survive a fork, so each prefork worker builds its own pool.
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool     = ThreadPoolExecutor(max_workers=len(self._entries), thread_name_prefix="xray-ensemble")
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    # ── Loading and eviction ──────────────────────────────────────────────────
+
+    @contextmanager
+    def acquire(self, model_id: str):
+        """The loaded model, loading it first if needed; it cannot be evicted while held."""
+        entry = self._entries[model_id]
+        with self._lock:
+            entry.in_use += 1
+            entry.uses   += 1
+            self._entries.move_to_end(model_id)
+        try:
+            if entry.loader is None:
+                with entry.load_lock:
+                    if entry.loader is None:
+                        self._load(entry)
+            yield entry.loader
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+            self._evict()
+
+    def _load(self, entry: _Entry):
+        # Every catalog model is a DenseNet-121, so any loaded one is a good
+        # estimate of the room the next one needs.
+        self._evict(headroom=max((e.size for e in self._snapshot()), default=0))
+        loader = XRayModelLoader(self.backend, None, self.variants, entry.weights)
+        if not loader.load_model():
+            raise RuntimeError(f"Failed to load model '{entry.model_id}'")
+        with self._lock:
+            entry.loader = loader
+            entry.size   = loader.memory_bytes()
+            entry.loads += 1
+        logger.info("Model loaded", extra={
+            "model": entry.model_id, "size_mb": round(entry.size / 2**20, 1), "loaded_mb": round(self.memory_used() / 2**20, 1),
+        })
+
+    def _evict(self, headroom: int = 0):
+        if self.memory_budget <= 0:
+            return
+        evicted = []
+        with self._lock:
+            used = sum(e.size for e in self._entries.values() if e.loader is not None)
+            for entry in self._entries.values():
+                if used + headroom <= self.memory_budget:
+                    break
+                if entry.loader is None or entry.pinned or entry.in_use:
+                    continue
+                entry.loader = None
+                used -= entry.size
+                self.evictions += 1
+                evicted.append(entry.model_id)
+        for model_id in evicted:
+            logger.info("Model unloaded", extra={"model": model_id, "loaded_mb": round(used / 2**20, 1)})
+
+    def memory_used(self) -> int:
+        return sum(e.size for e in self._snapshot() if e.loader is not None)
+
+    def _snapshot(self) -> list:
+        # acquire() reorders _entries from request threads; iterating it
+        # unlocked can raise "OrderedDict mutated during iteration".
+        with self._lock:
+            return list(self._entries.values())
+
+    # ── Reporting ─────────────────────────────────────────────────────────────
+
+    def catalog(self) -> list:
+        return [
+            {
+                "id":            e.model_id,
+                "weights":       e.weights,
+                "training_data": MODEL_CATALOG[e.model_id]["training_data"],
+                "conditions":    sum(1 for label in e.labels if label),
+                "pathologies":   [label for label in e.labels if label],
+                "default":       e.model_id == self.default,
+                "loaded":        e.loader is not None,
+            }
+            for e in sorted(self._snapshot(), key=lambda e: e.model_id != self.default)
+        ]
+
+    def get_stats(self) -> dict:
+        return {
+            "default":          self.default,
+            "ensemble":         list(self.ensemble),
+            "memory_budget_mb": round(self.memory_budget / 2**20, 1) if self.memory_budget else None,
+            "memory_used_mb":   round(self.memory_used() / 2**20, 1),
+            "evictions":        self.evictions,
+            "models": {
+                e.model_id: {"loaded": e.loader is not None, "in_use": e.in_use, "loads": e.loads, "uses": e.uses}
+                for e in self._snapshot()
+            },
+        }
@@ -0,0 +1,165 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+OVERLAY_ALPHA = 0.45
+
+
+def _jet(values: np.ndarray) -> np.ndarray:
+    """Map [0, 1] values to RGB with a jet-style colormap, as uint8."""
+    four = 4.0 * values
+    rgb  = np.stack([
+        np.clip(1.5 - np.abs(four - 3.0), 0.0, 1.0),
+        np.clip(1.5 - np.abs(four - 2.0), 0.0, 1.0),
+        np.clip(1.5 - np.abs(four - 1.0), 0.0, 1.0),
+    ], axis=-1)
+    return (rgb * 255).astype(np.uint8)
+
+
+class GradCAM:
+    """Grad-CAM heatmaps for the DenseNet, rendered on demand from cached activations.
+
+    A forward hook on the model's feature extractor keeps the final feature
+    maps of every analysis, together with a uint8 copy of the input image.
+    The classifier is a single linear layer over globally averaged, rectified
+    features, so the Grad-CAM channel weights for those features are that
+    layer's weights up to a positive scale (the sigmoid and operating-point
+    normalization are monotonic). Rendering therefore needs neither a second
+    forward pass nor a backward pass, and a saturated sigmoid cannot zero
+    the map. Activations and rendered PNGs are kept in separate LRU caches.
+    """
+
+    def __init__(self, module, classifier_weights, pathologies, max_entries: int = 256, max_images: int = 256):
+        self.weights     = np.asarray(classifier_weights, dtype=np.float32)
+        self.pathologies = list(pathologies)
+        self.max_entries = max(1, int(max_entries))
+        self.max_images  = max(0, int(max_images))
+        self._activations = OrderedDict()
+        self._images      = OrderedDict()
+        self._lock        = threading.Lock()
+        self._local       = threading.local()
+        self.renders      = 0
+        self.image_hits   = 0
+        module.features.register_forward_hook(self._hook)
+
+    # ── Capture ───────────────────────────────────────────────────────────────
+
+    def _hook(self, module, inputs, output):
+        # The model applies ReLU to this tensor in place right after the hook,
+        # so by the time take() reads it, it holds the pooled activations.
+        self._local.features = output
+
+    def take(self):
+        """Feature maps from this thread's last forward pass, [batch, C, H, W]."""
+        features = getattr(self._local, "features", None)
+        self._local.features = None
+        return features
+
+    def store(self, analysis_id: str, features, image):
+        """Keep one analysis' [C, H, W] features and its [224, 224] model input."""
+        features = features.detach().float().numpy().astype(np.float16)
+        image    = image.detach().numpy() if hasattr(image, "detach") else np.asarray(image)
+        gray     = np.clip((image + 1024.0) * (255.0 / 2048.0), 0, 255).astype(np.uint8)
+        self._put(self._activations, analysis_id, (features, gray), self.max_entries)
+
+    def link(self, analysis_id: str, source_id: str) -> bool:
+        """Reuse another analysis' activations, e.g. when its result came from the cache."""
+        with self._lock:
+            entry = self._activations.get(source_id)
+        if entry is None:
+            return False
+        self._put(self._activations, analysis_id, entry, self.max_entries)
+        return True
+
+    # ── Rendering ─────────────────────────────────────────────────────────────
+
+    def default_pathology(self, analysis_id: str):
+        """The pathology with the strongest class score for this analysis."""
+        entry = self._get(self._activations, analysis_id)
+        if entry is None:
+            return None
+        pooled = np.maximum(entry[0].astype(np.float32), 0).mean(axis=(1, 2))
+        scores = self.weights @ pooled
+        named  = [i for i, p in enumerate(self.pathologies) if p]
+        return self.pathologies[max(named, key=lambda i: scores[i])]
+
+    def render(self, analysis_id: str, pathology: str):
+        """PNG overlay for one pathology, or None if the analysis is no longer cached."""
+        key    = (analysis_id, pathology)
+        cached = self._get(self._images, key)
+        if cached is not None:
+            self.image_hits += 1
+            return cached
+
+        entry = self._get(self._activations, analysis_id)
+        if entry is None:
+            return None
+        features, gray = entry
+
+        column = self.pathologies.index(pathology)
+        cam    = np.tensordot(self.weights[column], np.maximum(features.astype(np.float32), 0), axes=1)
+        cam    = np.maximum(cam, 0)
+        peak   = cam.max()
+        cam    = cam / peak if peak > 0 else cam
+
+        heat = Image.fromarray((cam * 255).astype(np.uint8)).resize(gray.shape[::-1], Image.BILINEAR)
+        heat = _jet(np.asarray(heat, dtype=np.float32) / 255.0)
+        base = np.repeat(gray[..., None], 3, axis=-1)
+        blend = (base * (1 - OVERLAY_ALPHA) + heat * OVERLAY_ALPHA).astype(np.uint8)
+
+        buffer = io.BytesIO()
+        Image.fromarray(blend).save(buffer, format="PNG")
+        png = buffer.getvalue()
+        self.renders += 1
+        if self.max_images:
+            self._put(self._images, key, png, self.max_images)
+        return png
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled":        True,
+            "activations":    len(self._activations),
+            "max_entries":    self.max_entries,
+            "images":         len(self._images),
+            "max_images":     self.max_images,
+            "renders":        self.renders,
+            "image_hits":     self.image_hits,
+        }
+
+    # ── LRU helpers ───────────────────────────────────────────────────────────
+
+    def _get(self, cache: OrderedDict, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _put(self, cache: OrderedDict, key, value, limit: int):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > limit:
+                cache.popitem(last=False)
+
+
+def create_visualizer(model_loader, max_entries: int, max_images: int):
+    """GradCAM for the loaded model, or None when its backend cannot expose activations."""
+    backend = model_loader.model
+    if model_loader.backend != "torch" or "compile" in model_loader.variants:
+        logger.warning("Visualizations need the eager torch backend without torch.compile; disabled",
+                       extra={"backend": model_loader.backend, "variants": list(model_loader.variants)})
+        return None
+    return GradCAM(
+        backend.model,
+        model_loader.torch_model.classifier.weight.detach().numpy(),
+        model_loader.pathologies,
+        max_entries,
+        max_images,
+    )
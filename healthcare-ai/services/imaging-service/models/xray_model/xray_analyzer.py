@@ -1,56 +1,177 @@
+import time
 import uuid
+import logging
+import threading
+import numpy as np
 import torch
-from model_loader import XRayModelLoader
+from model_loader import MODEL_CATALOG, XRayModelLoader
 from nih_processor import NIHProcessor
+from batcher import InferenceBatcher
+from history import AnalysisHistory
+from visualizer import create_visualizer
+from registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
 
 
 class XRayAnalyzer:
-    def __init__(self):
-        self.model_loader = XRayModelLoader()
-        self.processor    = NIHProcessor()
-        self.analysis_history = []
+    def __init__(self, max_batch_size: int = 1, max_wait_ms: float = 0.0,
+                 fast_preprocess: bool = False,
+                 history: AnalysisHistory = None,
+                 backend: str = "torch", model_path: str = None, model_variants=(),
+                 visualization_cache: int = 0, visualization_images: int = 256,
+                 models=None, default_model: str = "nih", ensemble=(), memory_budget_mb: float = 0):
+        self.registry     = ModelRegistry(models, default_model, ensemble, memory_budget_mb, backend, model_variants)
+        self.model_loader = XRayModelLoader(backend, model_path, model_variants, MODEL_CATALOG[default_model]["weights"])
+        self.processor    = NIHProcessor(fast=fast_preprocess)
+        self._buffers     = threading.local()
+        self.batcher      = None
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms    = max_wait_ms
+        self.history        = history if history is not None else AnalysisHistory()
+        self.visualization_cache  = visualization_cache
+        self.visualization_images = visualization_images
+        self.visualizer     = None
+        self._forward       = None
 
     def initialize_model(self) -> bool:
-        return self.model_loader.load_nih_model()
+        if not self.model_loader.load_model():
+            return False
+        self.registry.pin(self.model_loader)
+        self._forward = self.model_loader.model
+        if self.visualization_cache > 0:
+            self.visualizer = create_visualizer(self.model_loader, self.visualization_cache, self.visualization_images)
+            if self.visualizer is not None:
+                self._forward = self._forward_with_features
+        if self.max_batch_size > 1:
+            self.batcher = InferenceBatcher(self._forward, self.max_batch_size, self.max_wait_ms)
+        return True
 
-    def analyze_xray(self, image_file, confidence_threshold: float = 0.5) -> dict:
-        try:
-            if hasattr(image_file, "seek"):
-                image_file.seek(0)
+    def _forward_with_features(self, tensor):
+        # Runs on the thread that did the forward pass, which is where the
+        # visualizer's hook left the feature maps.
+        outputs = self.model_loader.model(tensor)
+        return outputs, self.visualizer.take()
 
-            tensor = self.processor.preprocess_image(image_file)
+    def is_default(self, models) -> bool:
+        return not models or tuple(models) == (self.registry.default,)
 
-            print(f"  Tensor  mean={tensor.mean():.3f}  std={tensor.std():.3f}")
+    def predict(self, tensor, analysis_id: str = None, models=None):
+        """Output row for one [1, 1, 224, 224] input; models are registry ids, default model if omitted.
 
+        Only the default model goes through the batcher and the visualizer;
+        other models and ensembles run straight through the registry.
+        """
+        if not self.is_default(models):
+            return self.registry.predict(tensor, models)[0]
+        if self.batcher is not None:
+            result = self.batcher.predict(tensor)
+        else:
             with torch.no_grad():
-                outputs = self.model_loader.model(tensor)
+                result = self._forward(tensor)
+            result = tuple(r[0] for r in result) if isinstance(result, tuple) else result[0]
+        return self.finish_prediction(result, tensor, analysis_id)
+
+    def finish_prediction(self, result, tensor, analysis_id: str = None):
+        """Output row from one image's forward-pass result, keeping its feature maps when visualizing."""
+        if self.visualizer is None:
+            return result
+        outputs, features = result
+        if analysis_id:
+            self.visualizer.store(analysis_id, features, tensor[0, 0])
+        return outputs
+
+    def predict_batch(self, tensor, analysis_ids=None, models=None):
+        if not self.is_default(models):
+            return self.registry.predict(tensor, models)
+        with torch.no_grad():
+            result = self._forward(tensor)
+        if self.visualizer is None:
+            return result
+        outputs, features = result
+        for i, analysis_id in enumerate(analysis_ids or ()):
+            if analysis_id:
+                self.visualizer.store(analysis_id, features[i], tensor[i, 0])
+        return outputs
+
+    def infer(self, image_file, timings=None, analysis_id: str = None, models=None):
+        """Output row for one image; timings, if given, receives per-stage seconds."""
+        if hasattr(image_file, "seek"):
+            image_file.seek(0)
+
+        # The calling thread blocks until predict() returns, so its input
+        # buffer can safely be reused for the next image it handles.
+        tensor = self.processor.preprocess_image(image_file, out=self._input_buffer(), timings=timings)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Input tensor", extra={
+                "analysis_id": analysis_id, "mean": float(tensor.mean()), "std": float(tensor.std()),
+            })
+
+        start   = time.perf_counter()
+        outputs = self.predict(tensor, analysis_id, models)
+        if timings is not None:
+            timings["forward"] = time.perf_counter() - start
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Model output", extra={
+                "analysis_id": analysis_id, "shape": tuple(outputs.shape),
+                "min": float(outputs.min()), "max": float(outputs.max()),
+            })
+
+        return outputs
+
+    def _input_buffer(self):
+        buffer = getattr(self._buffers, "input", None)
+        if buffer is None:
+            buffer = self._buffers.input = np.empty((1, 1, 224, 224), dtype=np.float32)
+        return buffer
 
-            print(f"  Output  shape={outputs.shape}  "
-                  f"range=[{outputs.min():.3f}, {outputs.max():.3f}]")
+    def analyze_xray(self, image_file, confidence_threshold: float = 0.5) -> dict:
+        try:
+            return self.interpret(self.infer(image_file), confidence_threshold)
+        except Exception as e:
+            raise RuntimeError(f"X-Ray analysis failed: {e}") from e
+
+    def interpret(self, outputs, confidence_threshold: float = 0.5, analysis_id: str = None, models=None) -> dict:
+        return self.interpret_batch(outputs, [confidence_threshold], [analysis_id], models)[0]
+
+    def interpret_batch(self, outputs, confidence_thresholds, analysis_ids=None, models=None) -> list:
+        """Build one analysis record per row of a [batch, n_pathologies] output matrix."""
+        models      = tuple(models or (self.registry.default,))
+        pathologies = self.model_loader.pathologies if self.is_default(models) else self.registry.pathologies(models)
+        batch_findings = self.processor.interpret_nih_batch(outputs, pathologies, confidence_thresholds)
 
-            findings = self.processor.interpret_nih_results(
-                outputs[0], self.model_loader.pathologies, confidence_threshold
-            )
-            recommendations = self.processor.generate_recommendations(findings)
+        analysis_ids = analysis_ids or [None] * len(batch_findings)
 
+        records = []
+        for findings, threshold, analysis_id in zip(batch_findings, confidence_thresholds, analysis_ids):
             record = {
-                "analysis_id":          str(uuid.uuid4())[:8],
+                "analysis_id":          analysis_id or str(uuid.uuid4())[:8],
+                "model":                self.registry.key(models),
+                "model_used":           self.registry.describe(models),
                 "findings":             findings,
-                "recommendations":      recommendations,
-                "confidence_threshold": confidence_threshold,
+                "recommendations":      self.processor.generate_recommendations(findings),
+                "confidence_threshold": threshold,
                 "total_findings":       len(findings),
             }
-            self.analysis_history.append(record)
-            return record
-
-        except Exception as e:
-            raise RuntimeError(f"X-Ray analysis failed: {e}") from e
+            records.append(self.history.add(record))
+        return records
 
     def get_model_info(self) -> dict:
         return self.model_loader.get_model_info()
 
+    def get_model_stats(self) -> dict:
+        return self.registry.get_stats()
+
+    def get_visualization_stats(self) -> dict:
+        return self.visualizer.get_stats() if self.visualizer else {"enabled": False}
+
+    def get_batching_stats(self) -> dict:
+        return self.batcher.get_stats() if self.batcher else {"enabled": False}
+
     def get_analysis_history(self) -> list:
-        return self.analysis_history
+        return self.history.recent()
 
     def clear_history(self):
-        self.analysis_history = []
+        self.history.clear()
@@ -1,4 +1,5 @@
 from datetime import datetime
+from urllib.parse import quote
 
 
 # ── Condition metadata ────────────────────────────────────────────────────────
@@ -78,6 +79,11 @@ def get_condition_plain(condition: str) -> str:
 
 # ── Main formatter ────────────────────────────────────────────────────────────
 
+def visualization_url(analysis_id: str, pathology: str = None) -> str:
+    url = f"/analyze/xray/{analysis_id}/visualization"
+    return f"{url}?pathology={quote(pathology)}" if pathology else url
+
+
 def format_imaging_results(raw_results: dict, analysis_id: str, include_visualization: bool = False) -> dict:
     findings = raw_results.get("findings", [])
 
@@ -102,6 +108,8 @@ def format_imaging_results(raw_results: dict, analysis_id: str, include_visualiz
         }
         if include_plain:
             out["plain_language"] = get_condition_plain(cond)
+        if include_visualization:
+            out["visualization_url"] = visualization_url(analysis_id, finding["pathology"])
         return out
 
     if not findings:
@@ -127,10 +135,11 @@ def format_imaging_results(raw_results: dict, analysis_id: str, include_visualiz
             "Discuss these with your doctor at your next routine visit."
         )
 
-    return {
+    result = {
         "analysis_id":       analysis_id,
         "timestamp":         datetime.utcnow().isoformat(),
-        "model_used":        "DenseNet-121 / NIH ChestX-ray14",
+        "model":             raw_results.get("model", "nih"),
+        "model_used":        raw_results.get("model_used", "DenseNet-121 / NIH ChestX-ray14"),
         "overall_risk_level": overall_risk,
         "patient_summary":   patient_summary,
         "findings_summary": {
@@ -150,3 +159,7 @@ def format_imaging_results(raw_results: dict, analysis_id: str, include_visualiz
             "Always consult with a qualified healthcare professional before making any health decisions."
         ),
     }
+    if include_visualization:
+        top = findings[0]["pathology"] if findings else None
+        result["visualization_url"] = visualization_url(analysis_id, top)
+    return result
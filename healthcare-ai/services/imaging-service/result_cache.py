@@ -0,0 +1,71 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """LRU + TTL cache keyed by the SHA-256 of the upload.
+
+    Values are whatever the caller stores; the service keeps the raw model
+    outputs together with the id of the analysis that produced them.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl         = float(ttl_seconds)
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, outputs = entry
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return outputs
+
+    def put(self, key: str, outputs):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), outputs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled":     self.enabled,
+            "entries":     len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "hit_rate":    round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions":   self.evictions,
+            "expirations": self.expirations,
+        }
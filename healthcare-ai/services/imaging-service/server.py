@@ -1,19 +1,87 @@
+import json
 import uuid
-from io import BytesIO
+import shutil
+import tempfile
+import logging
+import asyncio
+import hashlib
+import zlib
+import zipfile
+import importlib.util
+from typing import List, Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from inference import analyze_xray_image
+import inference
+import metrics
+from logs import configure_logging
+from inference import (
+    XRAY_BACKEND, XRAY_MODEL_VARIANTS, ModelNotReady, UnknownModel, VisualizationUnavailable,
+    analyze_xray_image, analyze_xray_batch, get_history, get_runtime_stats,
+)
 from postproc import format_imaging_results
+from uploads import MULTIPART_OVERHEAD, BodyLimitMiddleware, read_upload
+from jobs import JobQueue, QueueFull
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+jobs = JobQueue(
+    max_queued    = inference.XRAY_JOB_QUEUE_SIZE,
+    workers       = inference.XRAY_JOB_WORKERS,
+    lease_seconds = inference.XRAY_JOB_LEASE_SECONDS,
+    result_ttl    = inference.XRAY_JOB_RESULT_TTL,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Prefork workers are forked here, before jobs.start() or any request can
+    # start another thread, so they are never loaded lazily.
+    if inference.XRAY_EAGER_LOAD or inference.XRAY_EXECUTOR == "prefork":
+        inference.start_background()
+    jobs.start()
+    yield
+    await jobs.stop()
+    inference.shutdown()
+
 
 app = FastAPI(
     title="Tammeny Imaging Service",
     description="AI-powered chest X-ray analysis (DenseNet-121 / NIH ChestX-ray14)",
     version="1.1.0",
+    lifespan=lifespan,
+)
+
+# DICOM is accepted when the optional pydicom package is installed. PACS
+# exports are often sent as application/octet-stream; the format is sniffed
+# from the file's own bytes either way.
+DICOM_SUPPORTED   = importlib.util.find_spec("pydicom") is not None
+DICOM_TYPES       = {"application/dicom", "application/octet-stream"} if DICOM_SUPPORTED else set()
+
+ALLOWED_TYPES     = {"image/jpeg", "image/jpg", "image/png"} | DICOM_TYPES
+ZIP_TYPES         = {"application/zip", "application/x-zip-compressed"}
+IMAGE_SUFFIXES    = (".jpg", ".jpeg", ".png") + ((".dcm",) if DICOM_SUPPORTED else ())
+MAX_SIZE_MB       = 10
+MAX_DICOM_SIZE_MB = 64
+MAX_BATCH_FILES   = 64
+MAX_SIZE          = MAX_SIZE_MB * 1024 * 1024
+MAX_DICOM_SIZE    = MAX_DICOM_SIZE_MB * 1024 * 1024
+MAX_BATCH_SIZE    = MAX_SIZE * MAX_BATCH_FILES
+# Accepted image formats, as sniffed from the upload, and their size limits.
+IMAGE_FORMATS     = {"image/jpeg": MAX_SIZE, "image/png": MAX_SIZE}
+if DICOM_SUPPORTED:
+    IMAGE_FORMATS["application/dicom"] = MAX_DICOM_SIZE
+
+app.add_middleware(
+    BodyLimitMiddleware,
+    limits={"/analyze/xray/batch": MAX_BATCH_SIZE + MULTIPART_OVERHEAD},
+    default=max(IMAGE_FORMATS.values()) + MULTIPART_OVERHEAD,
 )
 
 app.add_middleware(
@@ -24,8 +92,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ALLOWED_TYPES = {"image/jpeg", "image/jpg", "image/png"}
-MAX_SIZE_MB   = 10
+metrics.instrument(app, executor_stats=lambda: get_runtime_stats()["executor"])
 
 
 @app.get("/")
@@ -35,50 +102,283 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {
+        "status":    "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "model":     inference.get_status(),
+        **get_runtime_stats(),
+        "jobs":      jobs.get_stats(),
+    }
+
+
+@app.get("/health/live")
+async def liveness():
+    status = inference.get_status()
+    if status["state"] == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": status["error"]})
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    status = inference.get_status()
+    if not inference.is_ready():
+        return JSONResponse(status_code=503, content={"status": status["state"]}, headers={"Retry-After": "5"})
+    return {"status": "ready", **status}
+
+
+def _not_ready(e: ModelNotReady) -> HTTPException:
+    return HTTPException(503, str(e), headers={"Retry-After": "5"})
+
+
+MODEL_QUERY = Query(default=None, description="Model id, comma-separated ids to ensemble, or 'ensemble'")
 
 
 @app.get("/models")
 async def models():
+    catalog = inference.get_models()
     return {
+        "default":  catalog["default"],
+        "ensemble": catalog["ensemble"],
         "models": [{
-            "id":             "chest-xray-nih",
+            **model,
             "name":           "Chest X-Ray Analyzer",
             "architecture":   "DenseNet-121",
-            "training_data":  "NIH ChestX-ray14",
-            "conditions":     14,
+            "backend":        XRAY_BACKEND,
+            "variants":       list(XRAY_MODEL_VARIANTS),
             "input_formats":  list(ALLOWED_TYPES),
             "max_size_mb":    MAX_SIZE_MB,
-        }]
+            "max_dicom_size_mb": MAX_DICOM_SIZE_MB if DICOM_SUPPORTED else None,
+            "max_batch_files": MAX_BATCH_FILES,
+        } for model in catalog["models"]],
     }
 
 
+async def _resolve_models(model: Optional[str]) -> tuple:
+    try:
+        return await inference.resolve_models(model)
+    except ModelNotReady as e:
+        raise _not_ready(e)
+    except UnknownModel as e:
+        raise HTTPException(400, str(e))
+
+
 @app.post("/analyze/xray")
 async def analyze_xray(
     file: UploadFile = File(...),
     confidence_threshold: float = Query(default=0.5, ge=0.1, le=0.99),
     include_visualization: bool = Query(default=False),
+    model: Optional[str] = MODEL_QUERY,
 ):
     if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(400, f"Unsupported file type '{file.content_type}'. Allowed: {', '.join(ALLOWED_TYPES)}")
 
-    file_bytes = await file.read()
-
-    if len(file_bytes) > MAX_SIZE_MB * 1024 * 1024:
-        raise HTTPException(400, f"File too large. Maximum is {MAX_SIZE_MB} MB.")
-
+    models      = await _resolve_models(model)
+    digest      = hashlib.sha256()
+    size        = await read_upload(file, IMAGE_FORMATS, digest)
     analysis_id = str(uuid.uuid4())[:8]
-    print(f"[{analysis_id}] '{file.filename}' | {len(file_bytes)/1024:.1f} KB | threshold={confidence_threshold}")
+    image_hash  = digest.hexdigest()
+    logger.info("Analysis requested", extra={
+        "analysis_id": analysis_id, "upload": file.filename,
+        "size_kb": round(size / 1024, 1), "threshold": confidence_threshold, "models": list(models),
+    })
 
     try:
-        raw    = await analyze_xray_image(BytesIO(file_bytes), confidence_threshold)
-        result = format_imaging_results(raw, analysis_id, include_visualization)
+        # The spooled upload goes to the decoder as-is; nothing is copied here.
+        raw    = await analyze_xray_image(file.file, confidence_threshold, image_hash, analysis_id, models)
+        result = format_imaging_results(raw, analysis_id, include_visualization and inference.visualizations_enabled(raw))
         return JSONResponse(content=result)
     except HTTPException:
         raise
+    except ModelNotReady as e:
+        raise _not_ready(e)
     except Exception as e:
         raise HTTPException(500, f"Analysis failed: {e}")
 
 
+@app.get("/analyze/xray/{analysis_id}/visualization")
+async def visualization(analysis_id: str, pathology: Optional[str] = Query(default=None)):
+    try:
+        pathology, png = await asyncio.to_thread(inference.render_visualization, analysis_id, pathology)
+    except VisualizationUnavailable as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if png is None:
+        raise HTTPException(404, f"No cached activations for analysis '{analysis_id}'. Re-run the analysis.")
+    return Response(png, media_type="image/png", headers={
+        "X-Pathology":   pathology,
+        "Cache-Control": "private, max-age=3600",
+    })
+
+
+# ── Async jobs ────────────────────────────────────────────────────────────────
+
+@app.post("/jobs/xray", status_code=202)
+async def submit_xray_job(
+    request: Request,
+    confidence_threshold: float = Query(default=0.5, ge=0.1, le=0.99),
+    include_visualization: bool = Query(default=False),
+    priority: int = Query(default=5, ge=0, le=9, description="Lower values run first"),
+    model: Optional[str] = MODEL_QUERY,
+):
+    """Queue an X-ray (multipart field `file`) and return a job id to poll at /jobs/{job_id}."""
+    models = await _resolve_models(model)
+    # Checked before the form is parsed, so a full queue turns the upload away
+    # before its body is read.
+    try:
+        jobs.ensure_capacity()
+    except QueueFull as e:
+        raise _queue_full(e.retry_after)
+
+    form = await request.form()
+    try:
+        file = form.get("file")
+        if not hasattr(file, "content_type"):
+            raise HTTPException(400, "Missing multipart file field 'file'.")
+        if file.content_type not in ALLOWED_TYPES:
+            raise HTTPException(400, f"Unsupported file type '{file.content_type}'. Allowed: {', '.join(ALLOWED_TYPES)}")
+
+        digest = hashlib.sha256()
+        await read_upload(file, IMAGE_FORMATS, digest)
+        # The request's upload is closed when this handler returns, so the
+        # job keeps its own spooled copy; only large images spill to disk.
+        spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        await asyncio.to_thread(shutil.copyfileobj, file.file, spool)
+    finally:
+        await form.close()
+
+    image_hash = digest.hexdigest()
+
+    async def work(job):
+        raw = await analyze_xray_image(spool, confidence_threshold, image_hash, job.id, models)
+        return format_imaging_results(raw, job.id, include_visualization and inference.visualizations_enabled(raw))
+
+    try:
+        job = jobs.submit(work, priority, cleanup=spool.close)
+    except QueueFull as e:
+        raise _queue_full(e.retry_after)
+
+    logger.info("Job queued", extra={"job_id": job.id, "priority": priority, "upload": file.filename})
+    return JSONResponse(
+        status_code=202,
+        content={**job.to_dict(jobs.position(job)), "status_url": f"/jobs/{job.id}"},
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(default=0, ge=0, le=30, description="Long-poll for up to this many seconds")):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"No job with id '{job_id}'.")
+    job = await jobs.wait(job, wait)
+    return job.to_dict(jobs.position(job))
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, f"No job with id '{job_id}'.")
+    return job.to_dict()
+
+
+def _queue_full(retry_after: int) -> HTTPException:
+    return HTTPException(429, "Analysis queue is full. Retry later.", headers={"Retry-After": str(retry_after)})
+
+
+@app.get("/history")
+async def history(
+    since: Optional[datetime] = Query(default=None),
+    until: Optional[datetime] = Query(default=None),
+    risk_level: Optional[str] = Query(default=None, pattern="^(low|medium|high)$"),
+    limit: int = Query(default=50, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+):
+    store = await asyncio.to_thread(get_history)
+    return await asyncio.to_thread(store.query, since, until, risk_level, limit, offset)
+
+
+@app.get("/history/{analysis_id}")
+async def history_entry(analysis_id: str):
+    store = await asyncio.to_thread(get_history)
+    entry = await asyncio.to_thread(store.get, analysis_id)
+    if entry is None:
+        raise HTTPException(404, f"No analysis with id '{analysis_id}'.")
+    return entry
+
+
+def _unpack_zip(archive) -> list:
+    """(name, bytes) for each image in an uploaded zip. Blocking; call it off the event loop."""
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise HTTPException(400, "Invalid zip archive.")
+
+    with zf:
+        entries = [
+            info for info in zf.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_SUFFIXES)
+        ]
+        if not entries:
+            raise HTTPException(400, f"Zip archive contains no {'/'.join(s[1:].upper() for s in IMAGE_SUFFIXES)} images.")
+        if len(entries) > MAX_BATCH_FILES:
+            raise HTTPException(400, f"Too many images. Maximum is {MAX_BATCH_FILES} per batch.")
+        for info in entries:
+            limit_mb = MAX_DICOM_SIZE_MB if info.filename.lower().endswith(".dcm") else MAX_SIZE_MB
+            if info.file_size > limit_mb * 1024 * 1024:
+                raise HTTPException(400, f"'{info.filename}' is too large. Maximum is {limit_mb} MB.")
+
+        items = []
+        for info in entries:
+            try:
+                items.append((info.filename, zf.read(info)))
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                raise HTTPException(400, f"'{info.filename}' in the zip archive is corrupt: {e}")
+        return items
+
+
+@app.post("/analyze/xray/batch")
+async def analyze_xray_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    confidence_threshold: float = Query(default=0.5, ge=0.1, le=0.99),
+    include_visualization: bool = Query(default=False),
+    model: Optional[str] = MODEL_QUERY,
+):
+    models = await _resolve_models(model)
+
+    if len(files) == 1 and (files[0].content_type in ZIP_TYPES or (files[0].filename or "").lower().endswith(".zip")):
+        await read_upload(files[0], {"application/zip": MAX_BATCH_SIZE})
+        items = await asyncio.to_thread(_unpack_zip, files[0].file)
+    else:
+        if len(files) > MAX_BATCH_FILES:
+            raise HTTPException(400, f"Too many files. Maximum is {MAX_BATCH_FILES} per batch.")
+        items = []
+        for file in files:
+            if file.content_type not in ALLOWED_TYPES:
+                raise HTTPException(400, f"Unsupported file type '{file.content_type}' for '{file.filename}'. "
+                                         f"Allowed: {', '.join(ALLOWED_TYPES)}")
+            await read_upload(file, IMAGE_FORMATS)
+            items.append((file.filename, file.file))
+
+    batch_id = str(uuid.uuid4())[:8]
+    logger.info("Batch requested", extra={
+        "batch_id": batch_id, "images": len(items), "threshold": confidence_threshold, "models": list(models),
+    })
+
+    async def stream():
+        async for index, name, raw, error in analyze_xray_batch(items, confidence_threshold, batch_id, models):
+            if error is not None:
+                line = {"index": index, "filename": name, "error": error}
+            else:
+                visualize = include_visualization and inference.visualizations_enabled(raw)
+                line = format_imaging_results(raw, f"{batch_id}-{index}", visualize)
+                line = {"index": index, "filename": name, **line}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8002, reload=False)
\ No newline at end of file
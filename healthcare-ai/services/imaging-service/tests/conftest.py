@@ -0,0 +1,8 @@
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The server runs from the service directory with the model modules on its path.
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.join(SERVICE_DIR, "models", "xray_model"))
@@ -0,0 +1,83 @@
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+from backends import OnnxBackend, TorchBackend, TorchScriptBackend, create_backend, export_onnx, export_torchscript
+
+ATOL = 1e-4
+
+
+class TinyXRayNet(torch.nn.Module):
+    """Stand-in for the DenseNet: same [N, 1, 224, 224] input range and sigmoid outputs, a few kB of weights."""
+
+    def __init__(self, pathologies: int = 18):
+        super().__init__()
+        torch.manual_seed(0)
+        self.features = torch.nn.Sequential(
+            torch.nn.Conv2d(1, 8, 7, stride=4, padding=3),
+            torch.nn.BatchNorm2d(8),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(8, 16, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.AdaptiveAvgPool2d(1),
+        )
+        self.classifier = torch.nn.Linear(16, pathologies)
+
+    def forward(self, x):
+        x = x / 1024
+        return torch.sigmoid(self.classifier(torch.flatten(self.features(x), 1)))
+
+
+@pytest.fixture(scope="module")
+def model():
+    return TinyXRayNet().eval()
+
+
+@pytest.fixture(scope="module")
+def images():
+    torch.manual_seed(1)
+    return torch.rand(5, 1, 224, 224) * 2048 - 1024
+
+
+@pytest.fixture(scope="module")
+def expected(model, images):
+    with torch.no_grad():
+        return model(images).numpy()
+
+
+def outputs(backend, images) -> np.ndarray:
+    with torch.no_grad():
+        return backend(images).numpy()
+
+
+def test_torchscript_traced_matches_eager(model, images, expected):
+    np.testing.assert_allclose(outputs(TorchScriptBackend(model), images), expected, atol=ATOL)
+
+
+def test_torchscript_artifact_matches_eager(model, images, expected, tmp_path):
+    path = export_torchscript(model, str(tmp_path / "tiny.pt"))
+    np.testing.assert_allclose(outputs(create_backend("torchscript", model, path), images), expected, atol=ATOL)
+
+
+def test_onnx_matches_eager(model, images, expected, tmp_path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    path = export_onnx(model, str(tmp_path / "tiny.onnx"))
+    backend = OnnxBackend(path)
+    np.testing.assert_allclose(outputs(backend, images), expected, atol=ATOL)
+    # Exported with a dynamic batch axis, so single images run through the same graph.
+    np.testing.assert_allclose(outputs(backend, images[:1]), expected[:1], atol=ATOL)
+
+
+@pytest.mark.parametrize("variants", [("channels_last",), ("inference_mode",), ("channels_last", "inference_mode")])
+def test_exact_variants_match_eager(model, images, expected, variants):
+    # Variants may convert the module in place, so each gets its own copy.
+    backend = TorchBackend(copy.deepcopy(model), variants)
+    np.testing.assert_allclose(outputs(backend, images), expected, atol=ATOL)
+
+
+def test_quantized_variant_stays_close(model, images, expected):
+    # int8 weights in the classifier trade a little accuracy for speed.
+    np.testing.assert_allclose(outputs(TorchBackend(copy.deepcopy(model), ("quantized",)), images), expected, atol=1e-2)
@@ -0,0 +1,54 @@
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import inference
+import server
+
+PAYLOAD = bytes(range(256)) * 64
+
+
+def archive(compression: int, corrupt: str = None) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zf:
+        zf.writestr("good.png", b"\x89PNG\r\n\x1a\n" + b"\0" * 64)
+        zf.writestr("bad.png", PAYLOAD)
+    data = bytearray(buffer.getvalue())
+    if corrupt is not None:
+        # Overwrite the middle of bad.png's stored bytes, leaving the headers intact.
+        info  = zipfile.ZipFile(io.BytesIO(bytes(data))).getinfo(corrupt)
+        start = info.header_offset + 30 + len(info.filename) + len(info.extra) + info.compress_size // 2
+        data[start:start + 16] = b"\xff" * 16
+    return bytes(data)
+
+
+def test_unpack_zip_reads_every_image():
+    items = server._unpack_zip(io.BytesIO(archive(zipfile.ZIP_DEFLATED)))
+    assert [name for name, _ in items] == ["good.png", "bad.png"]
+    assert items[1][1] == PAYLOAD
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_unpack_zip_rejects_a_corrupt_member(compression):
+    with pytest.raises(HTTPException) as caught:
+        server._unpack_zip(io.BytesIO(archive(compression, corrupt="bad.png")))
+    assert caught.value.status_code == 400
+    assert "'bad.png'" in caught.value.detail
+
+
+def test_batch_with_corrupt_member_is_a_400(monkeypatch):
+    async def resolve_models(model=None):
+        return ("nih",)
+
+    monkeypatch.setattr(inference, "resolve_models", resolve_models)
+    # Without the `with` block the lifespan does not run, so no model is loaded.
+    client = TestClient(server.app)
+    resp   = client.post("/analyze/xray/batch", files={
+        "files": ("scans.zip", archive(zipfile.ZIP_DEFLATED, corrupt="bad.png"), "application/zip"),
+    })
+
+    assert resp.status_code == 400
+    assert "corrupt" in resp.json()["detail"]
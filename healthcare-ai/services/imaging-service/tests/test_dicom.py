@@ -0,0 +1,141 @@
+import io
+import tempfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pydicom = pytest.importorskip("pydicom")
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.pixels import apply_modality_lut, apply_voi_lut, pixel_array
+from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+import dicom
+from nih_processor import NIHProcessor
+
+SIZE = 224
+# Resampling before rather than after the intensity transform moves edge
+# pixels slightly: up to about one 8-bit gray level on these images.
+ATOL = 2 * 2048 / 255
+
+
+def phantom(rows: int, cols: int, low: int, high: int, seed: int = 0) -> np.ndarray:
+    """A smooth chest-like gradient with a few blobs, spanning [low, high]."""
+    rng  = np.random.default_rng(seed)
+    y, x = np.mgrid[0:rows, 0:cols] / np.array([rows, cols])[:, None, None]
+    image = 0.5 + 0.3 * np.sin(3 * x) * np.cos(2 * y)
+    for cy, cx in rng.uniform(0.2, 0.8, (3, 2)):
+        image += 0.2 * np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / 0.01)
+    image = (image - image.min()) / (image.max() - image.min())
+    return np.round(low + image * (high - low))
+
+
+def build(frames: list, bits_stored: int = 12, signed: bool = False, photometric: str = "MONOCHROME2",
+          rescale=None, window=None) -> bytes:
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID    = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID          = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta                 = meta
+    ds.SOPClassUID               = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID            = meta.MediaStorageSOPInstanceUID
+    ds.Modality                  = "DX"
+    ds.Rows, ds.Columns          = frames[0].shape
+    ds.SamplesPerPixel           = 1
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated             = 16
+    ds.BitsStored                = bits_stored
+    ds.HighBit                   = bits_stored - 1
+    ds.PixelRepresentation       = int(signed)
+    if len(frames) > 1:
+        ds.NumberOfFrames = len(frames)
+    if rescale is not None:
+        ds.RescaleSlope, ds.RescaleIntercept = rescale
+    if window is not None:
+        ds.WindowCenter, ds.WindowWidth = window
+    ds.PixelData = np.stack(frames).astype("<i2" if signed else "<u2").tobytes()
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def reference(data: bytes) -> np.ndarray:
+    """The first frame through pydicom's pixel_array and standard LUTs, mapped to [-1024, 1024] and resized."""
+    ds     = pydicom.dcmread(io.BytesIO(data))
+    frame  = pixel_array(io.BytesIO(data), index=0)
+    values = apply_modality_lut(frame, ds).astype(np.float64)
+    if "WindowCenter" in ds:
+        # The window's output range, found by pushing extreme values through it.
+        out       = apply_voi_lut(values, ds)
+        low, high = apply_voi_lut(np.array([-1e9, 1e9]), ds)
+    else:
+        out, low, high = values, values.min(), values.max()
+    scaled = (out - low) / (high - low) * 2048 - 1024
+    if ds.PhotometricInterpretation == "MONOCHROME1":
+        scaled = -scaled
+    return np.array(Image.fromarray(scaled.astype(np.float32), mode="F").resize((SIZE, SIZE)))
+
+
+CASES = {
+    "unsigned_12bit":  dict(frames=[phantom(512, 480, 0, 4095)]),
+    "signed_12bit":    dict(frames=[phantom(512, 480, -2048, 2047)], signed=True),
+    "monochrome1":     dict(frames=[phantom(512, 480, 200, 3900)], photometric="MONOCHROME1"),
+    "rescale_window":  dict(frames=[phantom(512, 480, 0, 4095)], rescale=(2, -1024), window=(2500, 4000)),
+    "narrow_window":   dict(frames=[phantom(512, 480, 0, 4095)], window=(2048, 3000)),
+    "multi_frame":     dict(frames=[phantom(512, 480, 0, 4095, seed) for seed in range(3)]),
+    "block_averaged":  dict(frames=[phantom(1100, 960, 0, 4095)]),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_matches_pixel_array_in_memory(case):
+    data   = build(**CASES[case])
+    actual = dicom.read_dicom(io.BytesIO(data), SIZE)
+
+    assert actual.shape == (SIZE, SIZE) and actual.dtype == np.float32
+    assert actual.min() >= -1024 and actual.max() <= 1024
+    np.testing.assert_allclose(actual, reference(data), atol=ATOL)
+
+
+@pytest.mark.parametrize("case", ["unsigned_12bit", "rescale_window", "multi_frame"])
+def test_matches_pixel_array_on_disk(case, tmp_path):
+    data = build(**CASES[case])
+    path = tmp_path / f"{case}.dcm"
+    path.write_bytes(data)
+
+    with open(path, "rb") as f:
+        assert dicom._on_disk(f)
+        actual = dicom.read_dicom(f, SIZE)
+    np.testing.assert_allclose(actual, reference(data), atol=ATOL)
+
+
+def test_spooled_upload_stays_in_memory():
+    data = build(**CASES["unsigned_12bit"])
+    with tempfile.SpooledTemporaryFile(max_size=len(data) * 2) as spool:
+        spool.write(data)
+        assert not dicom._on_disk(spool)
+        dicom.read_dicom(spool, SIZE)
+        assert spool.name is None             # still not rolled over to disk
+
+    with tempfile.SpooledTemporaryFile(max_size=1024) as spool:
+        spool.write(data)
+        assert dicom._on_disk(spool)
+        np.testing.assert_allclose(dicom.read_dicom(spool, SIZE), reference(data), atol=ATOL)
+
+
+def test_truncated_pixel_data_is_rejected():
+    data = build(**CASES["unsigned_12bit"])
+    with pytest.raises(Exception):
+        dicom.read_dicom(io.BytesIO(data[:len(data) // 2]), SIZE)
+
+
+def test_processor_routes_dicom_by_its_magic():
+    data = build(**CASES["monochrome1"])
+    assert dicom.is_dicom(data[:dicom.DICOM_MAGIC_OFFSET + len(dicom.DICOM_MAGIC)])
+
+    tensor = NIHProcessor().preprocess_image(io.BytesIO(data))
+    assert tuple(tensor.shape) == (1, 1, SIZE, SIZE)
+    np.testing.assert_allclose(tensor[0, 0].numpy(), reference(data), atol=ATOL)
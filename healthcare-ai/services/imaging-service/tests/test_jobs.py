@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from jobs import CANCELLED, DONE, EXPIRED, JobQueue, QueueFull
+
+
+def test_cancelled_jobs_free_their_slot():
+    async def run():
+        queue   = JobQueue(max_queued=2, workers=1)
+        release = asyncio.Event()
+
+        async def blocked(job):
+            await release.wait()
+            return "first"
+
+        async def quick(job):
+            return job.id
+
+        running = queue.submit(blocked)
+        await asyncio.sleep(0)            # the worker takes it, leaving the queue empty
+        queued  = [queue.submit(quick), queue.submit(quick)]
+        with pytest.raises(QueueFull):
+            queue.ensure_capacity()
+
+        for job in queued:
+            queue.cancel(job.id)
+        assert queue.get_stats()["queued"] == 0
+        queue.ensure_capacity()
+        again = [queue.submit(quick), queue.submit(quick)]
+        with pytest.raises(QueueFull):
+            queue.submit(quick)
+
+        release.set()
+        await asyncio.gather(*[queue.wait(job, 2) for job in [running, *again]])
+        await queue.stop()
+        return running, queued, again, queue.get_stats()
+
+    running, queued, again, stats = asyncio.run(run())
+
+    assert running.result == "first"
+    assert [job.status for job in queued] == [CANCELLED, CANCELLED]
+    assert [job.result for job in again] == [job.id for job in again]
+    assert stats["queued"] == 0 and stats["completed"] == 3 and stats["rejected"] == 2
+
+
+def test_expired_jobs_are_not_counted():
+    async def run():
+        queue = JobQueue(max_queued=1, workers=1, lease_seconds=0)
+
+        async def work(job):
+            return "ran"
+
+        job = queue.submit(work)
+        await queue.wait(job, 2)
+        queue.ensure_capacity()
+        await queue.stop()
+        return job, queue.get_stats()
+
+    job, stats = asyncio.run(run())
+
+    assert job.status == EXPIRED
+    assert stats["queued"] == 0 and stats["abandoned"] == 1
+
+
+def test_queued_jobs_run_in_priority_order():
+    async def run():
+        queue   = JobQueue(max_queued=4, workers=1)
+        release = asyncio.Event()
+        order   = []
+
+        async def blocked(job):
+            await release.wait()
+
+        async def record(job):
+            order.append(job.priority)
+
+        first = queue.submit(blocked)
+        await asyncio.sleep(0)
+        jobs  = [queue.submit(record, priority) for priority in (5, 1, 9, 3)]
+        release.set()
+        await asyncio.gather(*[queue.wait(job, 2) for job in [first, *jobs]])
+        await queue.stop()
+        return order, jobs
+
+    order, jobs = asyncio.run(run())
+
+    assert order == [1, 3, 5, 9]
+    assert all(job.status == DONE for job in jobs)
+
+
+def test_stop_finishes_running_jobs_and_closes_their_uploads():
+    async def run():
+        queue   = JobQueue(max_queued=2, workers=1)
+        started = asyncio.Event()
+        closed  = []
+
+        async def forever(job):
+            started.set()
+            await asyncio.Event().wait()
+
+        running = queue.submit(forever, cleanup=lambda: closed.append("running"))
+        queued  = queue.submit(forever, cleanup=lambda: closed.append("queued"))
+        await started.wait()
+        await queue.stop()
+        return running, queued, closed
+
+    running, queued, closed = asyncio.run(run())
+
+    assert running.status == CANCELLED and queued.status == CANCELLED
+    assert running.error == "Service shutting down"
+    assert sorted(closed) == ["queued", "running"]
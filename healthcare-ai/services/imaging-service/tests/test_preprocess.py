@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from nih_processor import NIHProcessor
+
+IMAGES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "Data", "Images")
+GRAY_LEVEL = 2048 / 255
+
+IMAGES = sorted(f for f in os.listdir(IMAGES_DIR) if f.lower().endswith((".png", ".jpg", ".jpeg")))
+
+
+def preprocess(path: str, fast: bool) -> np.ndarray:
+    with open(path, "rb") as f:
+        return NIHProcessor(fast=fast).preprocess_image(f).numpy()
+
+
+@pytest.mark.parametrize("name", IMAGES)
+def test_fast_path_matches_default(name):
+    path    = os.path.join(IMAGES_DIR, name)
+    default = preprocess(path, fast=False)
+    fast    = preprocess(path, fast=True)
+    diff    = np.abs(default - fast)
+
+    assert fast.shape == default.shape == (1, 1, 224, 224)
+    assert fast.dtype == default.dtype == np.float32
+    with Image.open(path) as img:
+        draft = img.format == "JPEG" and min(img.size) >= 2 * 224
+    if not draft:
+        # Without JPEG draft decoding the two paths do the same arithmetic.
+        assert diff.max() <= 1e-3
+        return
+    # Reduced-scale DCT decoding shifts some edge pixels, but the image as a
+    # whole stays within one gray level.
+    assert diff.mean() <= GRAY_LEVEL
+    assert diff.max() <= 24 * GRAY_LEVEL
+
+
+def test_fast_path_fills_a_given_buffer():
+    path = os.path.join(IMAGES_DIR, IMAGES[0])
+    out  = np.zeros((1, 1, 224, 224), dtype=np.float32)
+    with open(path, "rb") as f:
+        tensor = NIHProcessor(fast=True).preprocess_image(f, out=out)
+    assert np.shares_memory(tensor.numpy(), out)
+    np.testing.assert_allclose(out, preprocess(path, fast=False), atol=24 * GRAY_LEVEL)
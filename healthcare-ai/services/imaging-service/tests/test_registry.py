@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from registry import ModelRegistry
+
+MODELS = ("nih", "chex", "mimic_nb", "mimic_ch", "pc", "rsna", "all")
+
+
+class FakeLoader:
+    def memory_bytes(self) -> int:
+        return 1024
+
+
+@pytest.fixture
+def registry():
+    registry = ModelRegistry(MODELS, default="nih")
+    registry.pin(FakeLoader())
+    # Mark every model loaded so acquire() only reorders the LRU.
+    for model_id in MODELS[1:]:
+        registry._entries[model_id].loader = FakeLoader()
+    return registry
+
+
+def test_reporting_while_models_are_acquired(registry):
+    stop, errors = threading.Event(), []
+
+    def guarded(fn):
+        def run():
+            try:
+                while not stop.is_set():
+                    fn()
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+        return threading.Thread(target=run)
+
+    def acquire_round():
+        for model_id in MODELS[1:]:
+            with registry.acquire(model_id):
+                pass
+
+    def report():
+        registry.catalog()
+        registry.get_stats()
+        registry.memory_used()
+
+    threads = [guarded(acquire_round) for _ in range(4)] + [guarded(report) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    stop.wait(2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    stats = registry.get_stats()
+    assert all(model["in_use"] == 0 for model in stats["models"].values())
+    assert [model["id"] for model in registry.catalog()][0] == "nih"
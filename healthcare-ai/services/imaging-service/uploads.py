@@ -0,0 +1,120 @@
+import os
+import sys
+
+from fastapi import HTTPException, UploadFile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'xray_model'))
+
+from dicom import DICOM_MAGIC, DICOM_MAGIC_OFFSET, is_dicom
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of each accepted format, matched before the rest of the upload is read.
+MAGIC_BYTES = {
+    b"\xff\xd8\xff":      "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"PK\x03\x04":        "application/zip",
+}
+
+# DICOM puts its magic after a preamble rather than at the start.
+MAGIC_LENGTH = max(max(len(magic) for magic in MAGIC_BYTES), DICOM_MAGIC_OFFSET + len(DICOM_MAGIC))
+
+# Headroom for multipart boundaries and part headers on top of the file limits.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def sniff_type(head: bytes):
+    for magic, content_type in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return content_type
+    if is_dicom(head):
+        return "application/dicom"
+    return None
+
+
+async def read_upload(file: UploadFile, limits: dict, digest=None) -> int:
+    """Stream an upload in chunks, rejecting it as soon as it is too large or of the wrong format.
+
+    limits maps each accepted format, as sniffed from the leading bytes, to
+    its maximum size. The bytes stay in the upload's spooled temporary file,
+    which is rewound so it can be handed straight to the decoder. digest, if
+    given, is updated with every chunk. Returns the upload size in bytes.
+    """
+    name      = file.filename or "upload"
+    size      = 0
+    max_bytes = 0
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if size == 0:
+            if len(chunk) < MAGIC_LENGTH:
+                chunk += await file.read(MAGIC_LENGTH - len(chunk))
+            max_bytes = limits.get(sniff_type(chunk))
+            if max_bytes is None:
+                raise HTTPException(400, f"'{name}' is not a valid {' or '.join(sorted(_labels(limits)))} file.")
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(400, f"'{name}' is too large. Maximum is {max_bytes // (1024 * 1024)} MB.")
+        if digest is not None:
+            digest.update(chunk)
+
+    if size == 0:
+        raise HTTPException(400, f"'{name}' is empty.")
+    await file.seek(0)
+    return size
+
+
+def _labels(content_types) -> set:
+    return {content_type.split("/")[-1].upper() for content_type in content_types}
+
+
+class BodyLimitMiddleware:
+    """Rejects request bodies over a per-path limit while they are still arriving.
+
+    A declared Content-Length over the limit is refused before any of the body
+    is read; otherwise the body is counted as it streams in and the request
+    fails with 413 at the first chunk past the limit, so an oversized upload
+    is never spooled in full.
+    """
+
+    def __init__(self, app, limits: dict, default: int):
+        self.app     = app
+        self.limits  = limits
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit  = self.limits.get(scope["path"].rstrip("/") or "/", self.default)
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await _too_large(send, limit)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # HTTPException passes through FastAPI's body parsing and
+                    # is rendered by the app's own exception handler.
+                    raise HTTPException(413, f"Request body too large. Maximum is {limit // (1024 * 1024)} MB.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _too_large(send, limit: int):
+    body = ('{"detail":"Request body too large. Maximum is %d MB."}' % (limit // (1024 * 1024))).encode()
+    await send({
+        "type":    "http.response.start",
+        "status":  413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
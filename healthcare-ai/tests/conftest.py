@@ -0,0 +1,18 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+# The services are flat modules run from healthcare-ai/, not an installed package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mock_transport(monkeypatch):
+    """install(module, attribute, handler) swaps module.<attribute> for a client answered by handler."""
+    def install(module, attribute: str, handler) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(module, attribute, client)
+        return client
+    return install
@@ -0,0 +1,74 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import main
+import web_search
+from search_cache import SearchCache
+
+PAGES = {"https://a.org": "Fever is a raised body temperature.", "https://b.org": "Rest and drink fluids."}
+
+
+@pytest.fixture
+def search_api(monkeypatch, mock_transport):
+    """An enabled search API that answers slowly and counts its calls, with a fresh answer cache."""
+    calls = []
+
+    async def handler(request):
+        calls.append(json.loads(request.content)["query"])
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"results": [{"url": url, "content": text} for url, text in PAGES.items()]})
+
+    monkeypatch.setattr(web_search, "OLLAMA_API_KEY", "test-key")
+    monkeypatch.setattr(main, "llm", None)
+    monkeypatch.setattr(main, "cache", SearchCache(16, 60))
+    mock_transport(web_search, "_client", handler)
+    return calls
+
+
+def events(text: str) -> list:
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+async def post(client, path: str):
+    resp = await client.post(path, params={"prompt": "fever", "format": "ndjson"})
+    assert resp.status_code == 200
+    return resp.text
+
+
+def run(*paths):
+    async def go():
+        # No lifespan here, so cleaning runs on the loop's default executor.
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await asyncio.gather(*[post(client, path) for path in paths])
+    return asyncio.run(go())
+
+
+def test_concurrent_streams_share_one_search(search_api):
+    first, second = run("/chat/stream", "/chat/stream")
+
+    assert search_api == ["fever"]
+    for text in (first, second):
+        lines = events(text)
+        assert sorted(e["ref"] for e in lines if e["event"] == "result") == sorted(PAGES)
+        assert lines[-1]["event"] == "summary" and lines[-1]["count"] == 2
+
+
+def test_finished_stream_fills_the_cache(search_api):
+    run("/chat/stream")
+    (text,) = run("/chat/stream")
+    summary = events(text)[-1]
+
+    assert search_api == ["fever"]
+    assert summary["cached"] is True and summary["count"] == 2
+    assert main.cache.get(main.cache_key("fever"))["queries"] == ["fever"]
+
+
+def test_stream_and_chat_share_one_search(search_api):
+    streamed, answered = run("/chat/stream", "/chat")
+
+    assert search_api == ["fever"]
+    assert [e["index"] for e in events(streamed) if e["event"] == "result"] != []
+    assert [item["ref"] for item in json.loads(answered)["results"]] == list(PAGES)
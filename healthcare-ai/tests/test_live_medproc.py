@@ -0,0 +1,144 @@
+import io
+import json
+import time
+import base64
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import Live_MedProc as vision
+
+
+IMAGE = bytes(range(256)) * 300
+
+
+def body() -> vision.ImageBody:
+    payload = {"model": vision.MODEL_NAME, "image": f"data:image/jpeg;base64,{vision.IMAGE_MARKER}"}
+    return vision.ImageBody(payload, IMAGE)
+
+
+@pytest.fixture
+def upstream(monkeypatch, mock_transport):
+    """Fast-retry settings; the returned function serves the vision API from a handler behind a semaphore."""
+    monkeypatch.setattr(vision, "VISION_TIMEOUT", 5.0)
+    monkeypatch.setattr(vision, "VISION_RETRIES", 3)
+    monkeypatch.setattr(vision, "VISION_RETRY_BACKOFF", 0.0)
+
+    def install(handler, concurrency: int = 8):
+        mock_transport(vision, "client", handler)
+        monkeypatch.setattr(vision, "upstream", asyncio.Semaphore(concurrency))
+
+    return install
+
+
+def replies(*responses):
+    """Handler answering with the given (status, headers) pairs in turn, recording each request body."""
+    seen = []
+
+    async def handler(request):
+        seen.append(await request.aread())
+        status, headers = responses[min(len(seen), len(responses)) - 1]
+        content = {"choices": [{"message": {"role": "assistant", "content": "ok"}}]} if status == 200 else {"error": "busy"}
+        return httpx.Response(status, json=content, headers=headers)
+
+    return handler, seen
+
+
+def test_retries_429_and_503_then_succeeds(upstream):
+    handler, seen = replies((429, {}), (503, {}), (200, {}))
+    upstream(handler)
+
+    resp = asyncio.run(vision.post_completion(body()))
+
+    assert resp.status_code == 200
+    assert len(seen) == 3
+    # Every attempt streams the whole body again.
+    for sent in seen:
+        url = json.loads(sent)["image"]
+        assert base64.b64decode(url.split(",", 1)[1]) == IMAGE
+
+
+def test_gives_up_after_retries(upstream, monkeypatch):
+    monkeypatch.setattr(vision, "VISION_RETRIES", 2)
+    handler, seen = replies((503, {}))
+    upstream(handler)
+
+    resp = asyncio.run(vision.post_completion(body()))
+
+    assert resp.status_code == 503
+    assert len(seen) == 3
+
+
+def test_client_errors_are_not_retried(upstream):
+    handler, seen = replies((400, {}))
+    upstream(handler)
+
+    assert asyncio.run(vision.post_completion(body())).status_code == 400
+    assert len(seen) == 1
+
+
+def test_honours_retry_after(upstream):
+    handler, seen = replies((429, {"Retry-After": "1"}), (200, {}))
+    upstream(handler)
+
+    start = time.monotonic()
+    resp  = asyncio.run(vision.post_completion(body()))
+
+    assert resp.status_code == 200
+    assert time.monotonic() - start >= 1.0
+    assert len(seen) == 2
+
+
+def test_retry_after_past_the_deadline_returns_at_once(upstream, monkeypatch):
+    monkeypatch.setattr(vision, "VISION_TIMEOUT", 2.0)
+    handler, seen = replies((429, {"Retry-After": "30"}), (200, {}))
+    upstream(handler)
+
+    start = time.monotonic()
+    resp  = asyncio.run(vision.post_completion(body()))
+
+    assert resp.status_code == 429
+    assert time.monotonic() - start < 1.0
+    assert len(seen) == 1
+
+
+def test_concurrency_is_capped(upstream):
+    in_flight, peak = 0, 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return httpx.Response(200, json={})
+
+    async def burst():
+        upstream(handler, concurrency=2)
+        return await asyncio.gather(*[vision.post_completion(body()) for _ in range(10)])
+
+    responses = asyncio.run(burst())
+
+    assert [r.status_code for r in responses] == [200] * 10
+    assert peak == 2
+
+
+def test_deadline_returns_504(upstream, monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={})
+
+    upstream(handler)
+    monkeypatch.setattr(vision, "VISION_TIMEOUT", 0.2)
+    monkeypatch.setattr(vision, "HF_ROUTER_TOKEN", "test-token")
+
+    # Without the `with` block the lifespan does not run, so the mock client stays in place.
+    client = TestClient(vision.app)
+    start  = time.monotonic()
+    resp   = client.post("/analyze_image/", files={"image": ("scan.jpg", io.BytesIO(IMAGE), "image/jpeg")})
+
+    assert resp.status_code == 504
+    assert "0.2s" in resp.json()["error"]
+    assert time.monotonic() - start < 2.0
@@ -0,0 +1,126 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import web_search
+
+
+class FakeLLM:
+    """Translates by looking the query up in a dict, optionally after waiting for an event."""
+
+    def __init__(self, translations: dict, wait_for: asyncio.Event = None):
+        self.translations = translations
+        self.wait_for     = wait_for
+
+    async def ainvoke(self, prompt: str):
+        if self.wait_for is not None:
+            await asyncio.wait_for(self.wait_for.wait(), 2)
+        query = prompt.rsplit("\n\n", 1)[1]
+        return self.translations[query]
+
+
+def hit(url: str, content: str = "text") -> dict:
+    return {"title": url, "url": url, "content": content}
+
+
+@pytest.fixture
+def search_api(monkeypatch, mock_transport):
+    """Translation turned on; the returned function serves the search API from a handler."""
+    monkeypatch.setattr(web_search, "SEARCH_TRANSLATE", True)
+    return lambda handler: mock_transport(web_search, "_client", handler)
+
+
+def results_for(table: dict, seen: list = None):
+    async def handler(request):
+        query = json.loads(request.content)["query"]
+        if seen is not None:
+            seen.append(query)
+        return httpx.Response(200, json={"results": table[query]})
+    return handler
+
+
+def test_normalize_url():
+    assert web_search.normalize_url("https://www.Example.com/page/#top") == "//example.com/page"
+    assert web_search.normalize_url("http://example.com/page") == "//example.com/page"
+    assert web_search.normalize_url("https://example.com/page?id=2") == "//example.com/page?id=2"
+    assert web_search.normalize_url(None) == ""
+
+
+def test_merge_interleaves_and_drops_duplicate_urls():
+    english = [hit("https://a.org/x", "a-en"), hit("https://b.org/y/"), hit("https://c.org")]
+    arabic  = [hit("https://www.A.org/x#intro", "a-ar"), hit("https://d.org"), hit("https://b.org/y")]
+
+    merged = web_search.merge([english, arabic])
+
+    assert [item["url"] for item in merged] == ["https://a.org/x", "https://b.org/y/", "https://d.org", "https://c.org"]
+    assert merged[0]["content"] == "a-en"
+
+
+def test_merge_keeps_entries_without_a_url():
+    merged = web_search.merge([[{"content": "one"}], [{"content": "two"}]])
+    assert [item["content"] for item in merged] == ["one", "two"]
+
+
+def test_variants_run_concurrently_and_merge(search_api):
+    # The translation only finishes once the original query has reached the
+    # search API, so this would time out if the two ran one after the other.
+    original_sent = asyncio.Event()
+    seen = []
+    table = {
+        "diabetes diet": [hit("https://a.org/x"), hit("https://b.org")],
+        "حمية السكري":  [hit("https://www.a.org/x/"), hit("https://c.org")],
+    }
+
+    async def handler(request):
+        if json.loads(request.content)["query"] == "diabetes diet":
+            original_sent.set()
+        return await results_for(table, seen)(request)
+
+    async def run():
+        search_api(handler)
+        llm = FakeLLM({"diabetes diet": "حمية السكري"}, wait_for=original_sent)
+        return await web_search.search_variants("diabetes diet", llm)
+
+    queries, entries, errors = asyncio.run(run())
+
+    assert queries == ["diabetes diet", "حمية السكري"]
+    assert sorted(seen) == sorted(queries)
+    assert [item["url"] for item in entries] == ["https://a.org/x", "https://b.org", "https://c.org"]
+    assert errors == []
+
+
+def test_untranslated_query_is_searched_once(search_api):
+    seen = []
+    search_api(results_for({"fever": [hit("https://a.org")]}, seen))
+
+    queries, entries, errors = asyncio.run(web_search.search_variants("fever", FakeLLM({"fever": "Fever"})))
+
+    assert queries == ["fever"]
+    assert seen == ["fever"]
+    assert len(entries) == 1
+
+
+def test_upstream_error_is_reported(search_api):
+    search_api(lambda request: httpx.Response(502, json={"error": "bad gateway"}))
+
+    queries, entries, errors = asyncio.run(web_search.search_variants("fever"))
+
+    assert queries == ["fever"]
+    assert entries == []
+    assert len(errors) == 1 and "502" in errors[0]
+
+
+def test_failed_variant_keeps_the_other_results(search_api):
+    async def handler(request):
+        if json.loads(request.content)["query"] == "حمى":
+            raise httpx.ConnectError("connection refused")
+        return httpx.Response(200, json={"results": [hit("https://a.org")]})
+
+    search_api(handler)
+    queries, entries, errors = asyncio.run(web_search.search_variants("fever", FakeLLM({"fever": "حمى"})))
+
+    assert queries == ["fever", "حمى"]
+    assert [item["url"] for item in entries] == ["https://a.org"]
+    assert errors == ["connection refused"]
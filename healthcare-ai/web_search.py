@@ -0,0 +1,175 @@
+import os
+import re
+import asyncio
+import logging
+from itertools import zip_longest
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import httpx
+
+import metrics
+from content_cleaner import clean_content
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_URL = "https://ollama.com/api/web_search"
+
+OLLAMA_API_KEY         = os.getenv("OLLAMA_API_KEY")
+# Point this at a local stand-in server to run the API without an Ollama account.
+OLLAMA_SEARCH_URL      = os.getenv("OLLAMA_SEARCH_URL", DEFAULT_SEARCH_URL)
+SEARCH_MAX_RESULTS     = int(os.getenv("SEARCH_MAX_RESULTS", "3"))
+SEARCH_TIMEOUT         = float(os.getenv("SEARCH_TIMEOUT", "10"))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "20"))
+SEARCH_CLEAN_EXECUTOR  = os.getenv("SEARCH_CLEAN_EXECUTOR", "thread").lower()
+SEARCH_CLEAN_WORKERS   = int(os.getenv("SEARCH_CLEAN_WORKERS", "4"))
+SEARCH_TRANSLATE       = os.getenv("SEARCH_TRANSLATE", "0") == "1"
+
+ARABIC = re.compile(r'[\u0600-\u06FF]')
+
+_client = None
+_pool   = None
+
+
+def enabled() -> bool:
+    return bool(OLLAMA_API_KEY) or OLLAMA_SEARCH_URL != DEFAULT_SEARCH_URL
+
+
+# ── Lifecycle ─────────────────────────────────────────────────────────────────
+
+def start():
+    """Open the pooled HTTP client and the cleaning workers; called from the app lifespan."""
+    global _client, _pool
+    headers = {"Authorization": f"Bearer {OLLAMA_API_KEY}"} if OLLAMA_API_KEY else {}
+    _client = httpx.AsyncClient(
+        headers=headers,
+        timeout=httpx.Timeout(SEARCH_TIMEOUT, connect=min(SEARCH_TIMEOUT, 5.0)),
+        limits=httpx.Limits(max_connections=SEARCH_MAX_CONNECTIONS, max_keepalive_connections=SEARCH_MAX_CONNECTIONS),
+        follow_redirects=True,
+    )
+    executor = ProcessPoolExecutor if SEARCH_CLEAN_EXECUTOR == "process" else ThreadPoolExecutor
+    _pool    = executor(max_workers=max(1, SEARCH_CLEAN_WORKERS))
+
+
+async def stop():
+    global _client, _pool
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ── Search ────────────────────────────────────────────────────────────────────
+
+async def search(query: str) -> dict:
+    """Raw results for one query, as {"results": [{"title", "url", "content"}]}; errors come back as "error"."""
+    try:
+        with metrics.stage("search"):
+            response = await _client.post(OLLAMA_SEARCH_URL, json={"query": query, "max_results": SEARCH_MAX_RESULTS})
+            response.raise_for_status()
+            return response.json()
+    except Exception as exc:
+        logger.warning("Web search failed for %r: %s", query, exc)
+        return {"results": [], "error": str(exc) or type(exc).__name__}
+
+
+async def translate(query: str, llm):
+    """The query in English if it is Arabic and in Arabic otherwise; None when there is no LLM or it fails."""
+    if llm is None:
+        return None
+    target = "English" if ARABIC.search(query) else "Arabic"
+    prompt = (f"Translate this medical web search query into {target}. "
+              f"Reply with the translated query only.\n\n{query}")
+    try:
+        with metrics.stage("translate"):
+            reply = await asyncio.wait_for(llm.ainvoke(prompt), SEARCH_TIMEOUT)
+    except Exception as exc:
+        logger.warning("Query translation failed: %s", exc)
+        return None
+    text = str(getattr(reply, "content", reply)).strip().strip('"')
+    return text if text and text.casefold() != query.casefold() else None
+
+
+async def search_variants(prompt: str, llm=None):
+    """Search the prompt and, with SEARCH_TRANSLATE=1, its translation, concurrently.
+
+    The prompt's own search starts right away rather than waiting for the
+    translation. Returns the queries that were searched and their entries
+    merged by interleaving, keeping the first result for each URL.
+    """
+    async def translated():
+        query = await translate(prompt, llm)
+        return (query, await search(query)) if query else (None, None)
+
+    if SEARCH_TRANSLATE and llm is not None:
+        original, (query, other) = await asyncio.gather(search(prompt), translated())
+        responses = [(prompt, original)] + ([(query, other)] if query else [])
+    else:
+        responses = [(prompt, await search(prompt))]
+
+    queries = [query for query, _ in responses]
+    errors  = [r["error"] for _, r in responses if r.get("error")]
+    entries = merge([_entries(r) for _, r in responses])
+    return queries, entries, errors
+
+
+def merge(result_lists: list) -> list:
+    seen, merged = set(), []
+    for row in zip_longest(*result_lists):
+        for item in row:
+            if item is None:
+                continue
+            key = normalize_url(_field(item, "url"))
+            if key and key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    return merged
+
+
+def normalize_url(url) -> str:
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    path  = parts.path.rstrip("/")
+    host  = parts.netloc.lower().removeprefix("www.")
+    return urlunsplit(("", host, path, parts.query, ""))
+
+
+# ── Cleaning ──────────────────────────────────────────────────────────────────
+
+async def clean_entries(entries: list) -> list:
+    """[{"response", "ref"}] for each entry, cleaned concurrently in the worker pool."""
+    loop = asyncio.get_running_loop()
+    with metrics.stage("clean"):
+        cleaned = await asyncio.gather(*[
+            loop.run_in_executor(_pool, clean_content, _field(item, "content") or "") for item in entries
+        ])
+    return [
+        {"response": text, "ref": _field(item, "url") or "No reference"}
+        for item, text in zip(entries, cleaned)
+    ]
+
+
+async def clean_as_completed(entries: list):
+    """Yield (index, {"response", "ref"}) for each entry as soon as its cleaning finishes."""
+    loop = asyncio.get_running_loop()
+
+    async def clean(index, item):
+        text = await loop.run_in_executor(_pool, clean_content, _field(item, "content") or "")
+        return index, {"response": text, "ref": _field(item, "url") or "No reference"}
+
+    with metrics.stage("clean"):
+        for done in asyncio.as_completed([clean(i, item) for i, item in enumerate(entries)]):
+            yield await done
+
+
+def _entries(result) -> list:
+    entries = result.get("results") if isinstance(result, dict) else getattr(result, "results", None)
+    return entries or []
+
+
+def _field(item, name: str):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)